@@ -0,0 +1,318 @@
+"""
+Parallel multi-PV analysis: the best K moves of a position, searched by several processes.
+- Lazy SMP: every worker process runs the same iterative-deepening search on the position, and
+  all of them share one transposition table, so each worker's results cut the others' trees
+- workers skip depths another worker has already finished (odd-numbered helpers run one ply
+  ahead) and abandon an iteration as soon as someone else completes it
+- the table lives in multiprocessing.shared_memory: 16-byte slots of (key ^ data, data) written
+  without locks; a torn or racing write fails the XOR check and reads as a miss
+- multi-PV at the root: once K moves have exact scores, the rest are searched against the
+  K-th best score and only enter the list if they beat it
+- analyse() yields an AnalysisUpdate (depth, K lines, total nodes) each time a deeper iteration
+  completes; the CLI prints them as they arrive
+
+Usage: python analysis.py [--fen FEN] [--multipv K] [--workers N] [--depth N] [--time SECONDS] [--nodes N]
+       python analysis.py --scaling [--fen FEN] [--depth N] [--workers N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+from bitboard import BitboardGameState
+from chess_engine import Move
+from engine_worker import encode_game, replay_game
+from search import INFINITY, MATE_SCORE, MAX_PLY, SearchResult, Searcher, SearchTimeout, move_notation
+from tablebase import Tablebases
+
+# packed entry: move code (18 bits) | has move << 18 | depth << 19 | flag << 27 | age << 29 | score << 37,
+# the score stored with SCORE_OFFSET added so it is never negative
+SCORE_OFFSET = 1 << 19
+
+
+class SharedTranspositionTable:
+    """TranspositionTable with the same probe()/store() interface and replacement rule, stored
+    in a shared memory segment that every analysis worker maps.
+
+    Each slot is two 64-bit words: the key XOR the packed entry, then the packed entry. A reader
+    accepts a slot only if the two words XOR back to its key, so an entry half-written by another
+    process, or two writers interleaving, looks like an empty slot instead of a wrong result.
+    """
+
+    def __init__(self, size=1 << 20, name=None):
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.size * 16)
+            self.shm.buf[:] = bytes(self.size * 16)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.slots = self.shm.buf.cast('Q')
+        self.age = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        self.shm.buf[:] = bytes(self.size * 16)
+
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        data = self.slots[index + 1]
+        if not data or self.slots[index] ^ data != key:
+            return None
+        move_code = data & 0x3FFFF if data >> 18 & 1 else None
+        return (data >> 19 & 0xFF, (data >> 37) - SCORE_OFFSET, data >> 27 & 3, move_code, data >> 29 & 0xFF)
+
+    def store(self, key, depth, score, flag, move_code):
+        index = (key & self.mask) << 1
+        slots = self.slots
+        old = slots[index + 1]
+        same = bool(old) and slots[index] ^ old == key
+        if old and not same and old >> 29 & 0xFF == self.age and depth < old >> 19 & 0xFF:
+            return
+        if move_code is None and same and old >> 18 & 1:
+            move_code = old & 0x3FFFF
+        data = (0 if move_code is None else move_code | 1 << 18) | depth << 19 | flag << 27 | self.age << 29 \
+            | (score + SCORE_OFFSET) << 37
+        slots[index + 1] = data
+        slots[index] = key ^ data
+
+    def close(self):
+        self.slots.release()
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class AnalysisSearcher(Searcher):
+    def root_iteration(self, gs, depth, root_moves, multipv):
+        """Search every root move to `depth`; return the best `multipv` as (score, move, promotion)
+        best first with exact scores, and all root moves reordered for the next iteration."""
+        best = []
+        rest = []
+        for mv, promotion in root_moves:
+            alpha = best[-1][0] if len(best) >= multipv else -INFINITY
+            self._make(gs, mv, promotion)
+            score = -self._negamax(gs, depth - 1, -INFINITY, -alpha, 1)
+            gs.undo_move()
+            if score > alpha:
+                best.append((score, mv, promotion))
+                best.sort(key=lambda line: -line[0])
+                if len(best) > multipv:
+                    rest.append(best.pop())
+            else:
+                rest.append((score, mv, promotion))
+        rest.sort(key=lambda line: -line[0])
+        return best, [(mv, promotion) for _, mv, promotion in best + rest]
+
+    def line(self, gs, depth, move, promotion):
+        self._make(gs, move, promotion)
+        pv = [move_notation(move, promotion)] + self._principal_variation(gs, depth - 1)
+        gs.undo_move()
+        return pv
+
+
+def _worker(index, tt_name, tt_size, fen, codes, options, results, stop, completed, node_counts):
+    tt = SharedTranspositionTable(tt_size, name=tt_name)
+    tablebase_dir = options["tablebase_dir"]
+    searcher = AnalysisSearcher(tt, Tablebases(tablebase_dir) if tablebase_dir else None)
+    try:
+        _run_worker(index, searcher, replay_game(codes, fen), options, results, stop, completed, node_counts)
+    finally:
+        results.put((index, None, None))
+        tt.close()
+
+
+def _run_worker(index, searcher, gs, options, results, stop, completed, node_counts):
+    start = time.perf_counter()
+    time_limit = options["time_limit"]
+    max_depth = min(options["depth"] or MAX_PLY, MAX_PLY)
+    searcher.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+    root_moves = searcher._ordered_moves(gs.get_valid_moves(), None, 0)
+    if not root_moves:
+        return
+    multipv = min(options["multipv"], len(root_moves))
+    root_length = len(gs.move_log)
+    current = [0]
+
+    def should_stop():
+        node_counts[index] = searcher.nodes
+        return stop.is_set() or completed.value >= current[0]
+
+    searcher.should_stop = should_stop
+    finished = 0
+    while not stop.is_set():
+        depth = min(max(finished + 1, completed.value + 1 + index % 2), max_depth)
+        if depth <= finished:
+            break
+        if depth > 1:
+            searcher.deadline = start + time_limit if time_limit else None
+            searcher.node_limit = options["node_limit"]
+        current[0] = depth
+        try:
+            best, root_moves = searcher.root_iteration(gs, depth, root_moves, multipv)
+        except SearchTimeout:
+            while len(gs.move_log) > root_length:
+                gs.undo_move()
+            out_of_time = searcher.deadline and time.perf_counter() >= searcher.deadline
+            out_of_nodes = searcher.node_limit and searcher.nodes >= searcher.node_limit
+            if out_of_time or out_of_nodes:
+                break
+            continue  # another worker finished this depth first
+        finished = depth
+        node_counts[index] = searcher.nodes
+        with completed.get_lock():
+            first = completed.value < depth
+            if first:
+                completed.value = depth
+        if first:
+            lines = [(score, mv.encode(promotion), searcher.line(gs, depth, mv, promotion))
+                     for score, mv, promotion in best]
+            results.put((index, depth, (searcher.nodes, lines)))
+        if all(abs(score) >= MATE_SCORE - MAX_PLY for score, _, _ in best):
+            break
+        # the next iteration costs several times this one, so don't start what can't finish
+        if time_limit and time.perf_counter() - start > time_limit / 2:
+            break
+
+
+class AnalysisUpdate:
+    def __init__(self, depth, lines, nodes, elapsed, worker):
+        self.depth = depth
+        self.lines = lines  # SearchResult per principal variation, best first
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.worker = worker
+
+    def __str__(self):
+        return "\n".join(f"multipv {k} {line}" for k, line in enumerate(self.lines, 1))
+
+
+def analyse(gs, multipv=1, workers=None, depth=None, time_limit=None, node_limit=None, fen=None,
+            tt_size=1 << 20, tablebase_dir=None):
+    """Analyse the current position of `gs` (whose moves were played from `fen`, default the
+    initial position) with `workers` processes sharing one transposition table.
+
+    Yields an AnalysisUpdate whenever some worker completes a deeper iteration; the last one is
+    the final answer. Stops at `depth`, after `time_limit` seconds, or once `node_limit` nodes
+    are spent in total (split evenly between the workers).
+    """
+    workers = workers or os.cpu_count() or 1
+    # spawned like engine_worker's processes, so calling this from the UI doesn't fork pygame
+    context = multiprocessing.get_context("spawn")
+    tt = SharedTranspositionTable(tt_size)
+    results = context.Queue()
+    stop = context.Event()
+    completed = context.Value('i', 0)
+    node_counts = context.Array('q', workers, lock=False)
+    options = {"multipv": multipv, "depth": depth, "time_limit": time_limit,
+               "node_limit": max(1, node_limit // workers) if node_limit else None, "tablebase_dir": tablebase_dir}
+    codes = encode_game(gs)
+    processes = [context.Process(target=_worker, daemon=True,
+                                 args=(i, tt.name, tt.size, fen, codes, options, results, stop, completed, node_counts))
+                 for i in range(workers)]
+    start = time.perf_counter()
+    try:
+        for process in processes:
+            process.start()
+        running = workers
+        reported = 0
+        while running:
+            try:
+                index, done_depth, payload = results.get(timeout=0.05)
+            except queue.Empty:
+                if time_limit and reported and time.perf_counter() - start >= time_limit:
+                    stop.set()
+                continue
+            if done_depth is None:
+                running -= 1
+                stop.set()  # a worker only gives up when the budget is spent or the result is final
+                continue
+            if done_depth <= reported:
+                continue  # queues from different workers can deliver out of order
+            reported = done_depth
+            elapsed = time.perf_counter() - start
+            worker_nodes, lines = payload
+            nodes = sum(node_counts) - node_counts[index] + worker_nodes  # others are read as they are now
+            found = []
+            for score, code, pv in lines:
+                move, promotion = Move.decode(code, gs.board)
+                found.append(SearchResult(move, promotion, score, done_depth, pv, nodes, elapsed))
+            yield AnalysisUpdate(done_depth, found, nodes, elapsed, index)
+            if depth and done_depth >= depth:
+                stop.set()
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        tt.close()
+        tt.unlink()
+
+
+def time_to_depth(gs, depth, workers, fen=None, tt_size=1 << 20):
+    """Seconds until `depth` completes (first update at that depth) and the nodes searched."""
+    last = None
+    for update in analyse(gs, workers=workers, depth=depth, fen=fen, tt_size=tt_size):
+        last = update
+    return last.elapsed, last.nodes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-PV analysis with several search processes")
+    parser.add_argument("--fen", help="position to analyse (default: initial position)")
+    parser.add_argument("--multipv", type=int, default=3, help="number of best moves to report (default 3)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="search processes (default: one per core)")
+    parser.add_argument("--depth", type=int, help="maximum depth")
+    parser.add_argument("--time", type=float, help="time budget in seconds")
+    parser.add_argument("--nodes", type=int, help="node budget, shared by the workers")
+    parser.add_argument("--tt-size", type=int, default=1 << 20, help="shared transposition table slots")
+    parser.add_argument("--tablebases", help="directory of tablebase files from tablebase.py")
+    parser.add_argument("--scaling", action="store_true",
+                        help="time to --depth with 1, 2, 4, ... up to --workers processes")
+    args = parser.parse_args(argv)
+
+    gs = BitboardGameState()
+    if args.fen:
+        try:
+            gs.load_fen(args.fen)
+        except ValueError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 2
+    if not gs.has_legal_move():
+        print("no legal moves: " + gs.game_status())
+        return 0
+    depth = args.depth if args.depth or args.time or args.nodes else 5
+
+    if args.scaling:
+        counts = sorted({1 << i for i in range(args.workers.bit_length()) if 1 << i <= args.workers} | {args.workers})
+        baseline = None
+        for workers in counts:
+            elapsed, nodes = time_to_depth(gs, depth, workers, args.fen, args.tt_size)
+            baseline = baseline or elapsed
+            print(f"workers {workers:3}  depth {depth}  time {elapsed:8.2f}s  nodes {nodes:10}  "
+                  f"speedup {baseline / elapsed:5.2f}x")
+        return 0
+
+    last = None
+    for update in analyse(gs, args.multipv, args.workers, depth, args.time, args.nodes, args.fen, args.tt_size,
+                          args.tablebases):
+        for text in str(update).splitlines():
+            print("info", text)
+        last = update
+    if last and last.lines:
+        print("bestmove", last.lines[0].pv[0])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Batch position evaluation over FEN streams.
+- one GameState (and one search transposition table) is reused for every position
+- results are yielded one at a time, so memory stays flat however many positions go through
+- each result holds the legal-move count, check/checkmate/stalemate flags and, if a search
+  budget is given, the engine score and best move
+- malformed FENs produce an "error" result instead of stopping the stream
+- --profile adds each position's engine counters and timings (see profiling.py)
+
+Usage: python batch.py positions.fen [--depth N | --time SECONDS | --nodes N] [--profile] > results.jsonl
+       (use - to read FENs from stdin; blank lines and lines starting with # are skipped)
+"""
+
+import argparse
+import json
+import sys
+
+from bitboard import BitboardGameState
+import profiling
+from search import Searcher, TranspositionTable, move_notation
+
+
+def evaluate_fens(fens, depth=None, time_limit=None, node_limit=None, backend=BitboardGameState, tt_size=1 << 16):
+    """Yield a result dict for every FEN in the iterable `fens`.
+
+    While profiling is enabled each result also carries a "profile" snapshot for that position.
+    """
+    gs = backend()
+    searcher = Searcher(TranspositionTable(tt_size)) if depth or time_limit or node_limit else None
+    for fen in fens:
+        fen = fen.strip()
+        if not fen or fen.startswith("#"):
+            continue
+        if profiling.enabled():
+            profiling.reset()
+        try:
+            gs.load_fen(fen)
+        except ValueError as e:
+            yield {"fen": fen, "error": str(e)}
+            continue
+        moves = gs.get_valid_moves()
+        # each promotion choice is a separate legal move
+        legal_moves = len(moves) + 3 * sum(1 for mv in moves if mv.is_promotion)
+        result = {"fen": fen, "legal_moves": legal_moves, "check": gs.check,
+                  "checkmate": gs.checkmate, "stalemate": gs.stalemate}
+        if searcher and moves:
+            found = searcher.search(gs, depth=depth, time_limit=time_limit, node_limit=node_limit)
+            result["score"] = found.score
+            result["best_move"] = move_notation(found.move, found.promotion) if found.move else None
+            result["depth"] = found.depth
+            result["nodes"] = found.nodes
+        if profiling.enabled():
+            result["profile"] = profiling.snapshot()
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a stream of FEN positions")
+    parser.add_argument("path", help="file with one FEN per line, or - for stdin")
+    parser.add_argument("--depth", type=int, help="search each position to this depth")
+    parser.add_argument("--time", type=float, help="search each position for this many seconds")
+    parser.add_argument("--nodes", type=int, help="search each position for this many nodes")
+    parser.add_argument("--profile", action="store_true", help="add per-position engine counters and timings")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
+
+    source = sys.stdin if args.path == "-" else open(args.path)
+    try:
+        for result in evaluate_fens(source, depth=args.depth, time_limit=args.time, node_limit=args.nodes):
+            sys.stdout.write(json.dumps(result) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
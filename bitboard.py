@@ -0,0 +1,442 @@
+"""
+Bitboard board backend for the chess engine.
+- one 64-bit integer per piece type and color ("wp", "bn", ...)
+- square index = row * 8 + col, matching GameState.board (row 0 is rank 8)
+- precomputed knight, king and pawn attack tables
+- sliding-piece attacks from precomputed rays (nearest blocker via lsb/msb)
+- BitboardGameState keeps the same board/make_move/undo_move/get_valid_moves API
+- staged generation builds captures and quiet moves from separate target masks
+- checkers, pins and the enemy attack map are masks too, so legality never reads the grid
+"""
+
+from chess_engine import GameState, Move
+
+PIECES = ["wp", "wr", "wn", "wb", "wq", "wk", "bp", "br", "bn", "bb", "bq", "bk"]
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+
+ROOK_DIRECTIONS = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def bit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def iter_squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _offset_table(offsets):
+    table = []
+    for r, c in SQUARES:
+        mask = 0
+        for dr, dc in offsets:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < 8 and 0 <= cc < 8:
+                mask |= bit(rr, cc)
+        table.append(mask)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for r, c in SQUARES:
+        mask = 0
+        rr, cc = r + dr, c + dc
+        while 0 <= rr < 8 and 0 <= cc < 8:
+            mask |= bit(rr, cc)
+            rr, cc = rr + dr, cc + dc
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(KING_OFFSETS)
+# squares attacked by a pawn of the given color standing on each square
+PAWN_ATTACKS = {'w': _offset_table([(-1, -1), (-1, 1)]),
+                'b': _offset_table([(1, -1), (1, 1)])}
+
+# (rays, positive) pairs; positive rays run towards higher square indices,
+# so their nearest blocker is the lowest set bit, otherwise the highest
+ROOK_RAYS = [(_ray_table(dr, dc), dr > 0 or (dr == 0 and dc > 0)) for dr, dc in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr > 0) for dr, dc in BISHOP_DIRECTIONS]
+
+
+def _slide(ray_tables, sq, occupied):
+    attacks = 0
+    for rays, positive in ray_tables:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= rays[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return _slide(ROOK_RAYS, sq, occupied)
+
+
+def bishop_attacks(sq, occupied):
+    return _slide(BISHOP_RAYS, sq, occupied)
+
+
+def queen_attacks(sq, occupied):
+    return _slide(ROOK_RAYS, sq, occupied) | _slide(BISHOP_RAYS, sq, occupied)
+
+
+class BitboardGameState(GameState):
+    def __init__(self):
+        super().__init__()
+        self.load_bitboards()
+
+    def load_bitboards(self):
+        """Rebuild every bitboard from self.board."""
+        self.bitboards = {p: 0 for p in PIECES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for sq, (r, c) in enumerate(SQUARES):
+            piece = self.board[r][c]
+            if piece != "--":
+                self.bitboards[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+
+    def load_fen(self, fen):
+        super().load_fen(fen)
+        self.load_bitboards()
+        self.check = self.in_check()
+
+    def _toggle(self, piece, r, c):
+        b = bit(r, c)
+        self.bitboards[piece] ^= b
+        self.occupancy[piece[0]] ^= b
+
+    def _toggle_move(self, move, piece_at_end):
+        color = move.piece_moved[0]
+        piece_at_start = color + 'p' if move.is_promotion else move.piece_moved
+        self._toggle(piece_at_start, move.start_row, move.start_col)
+        self._toggle(piece_at_end, move.end_row, move.end_col)
+        if move.piece_captured != "--":
+            if move.is_enpassant_move:
+                self._toggle(move.piece_captured, *move.enpassant_pawn_location)
+            else:
+                self._toggle(move.piece_captured, move.end_row, move.end_col)
+        if move.is_castle_move:
+            if move.end_col - move.start_col == 2:
+                rook_start_col, rook_end_col = 7, move.end_col - 1
+            else:
+                rook_start_col, rook_end_col = 0, move.end_col + 1
+            self._toggle(color + 'r', move.start_row, rook_start_col)
+            self._toggle(color + 'r', move.start_row, rook_end_col)
+
+    def make_move(self, move):
+        super().make_move(move)
+        self._toggle_move(move, move.piece_moved)
+
+    def undo_move(self):
+        if not self.move_log:
+            return
+        move = self.move_log[-1]
+        # the square may hold a promoted piece by now, so read it off the board
+        self._toggle_move(move, self.board[move.end_row][move.end_col])
+        super().undo_move()
+
+    def promote_pawn(self, piece):
+        _, r, c = self.pawn_promotion
+        self._toggle(self.board[r][c], r, c)
+        self._toggle(piece, r, c)
+        super().promote_pawn(piece)
+
+    def attackers_exist(self, sq, color):
+        """True if any piece of `color` attacks square index `sq`."""
+        bb = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bb[color + 'n']:
+            return True
+        if KING_ATTACKS[sq] & bb[color + 'k']:
+            return True
+        if PAWN_ATTACKS['b' if color == 'w' else 'w'][sq] & bb[color + 'p']:
+            return True
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        queens = bb[color + 'q']
+        straight = bb[color + 'r'] | queens
+        if straight and rook_attacks(sq, occupied) & straight:
+            return True
+        diagonal = bb[color + 'b'] | queens
+        if diagonal and bishop_attacks(sq, occupied) & diagonal:
+            return True
+        return False
+
+    def square_under_attack(self, r, c):
+        return self.attackers_exist(r * 8 + c, 'b' if self.white_to_move else 'w')
+
+    def _move_constraints(self):
+        """(king row, king col, checker squares, block mask, {pinned square: allowed mask}),
+        with squares as indices; the legality filter below reads these masks."""
+        color, opp = ('w', 'b') if self.white_to_move else ('b', 'w')
+        kr, kc = self.white_king_location if self.white_to_move else self.black_king_location
+        ksq = kr * 8 + kc
+        bb = self.bitboards
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[opp]
+        checkers = []
+        block = 0
+        pins = {}
+        queens = bb[opp + 'q']
+        for ray_tables, sliders in ((ROOK_RAYS, bb[opp + 'r'] | queens), (BISHOP_RAYS, bb[opp + 'b'] | queens)):
+            if not sliders:
+                continue
+            for rays, positive in ray_tables:
+                ray = rays[ksq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                if sliders >> first & 1:
+                    checkers.append(first)
+                    block |= ray ^ rays[first]
+                elif own >> first & 1:
+                    # a pin needs the next piece along the ray to be one of these sliders
+                    beyond = blockers & rays[first]
+                    second = (beyond & -beyond).bit_length() - 1 if positive else beyond.bit_length() - 1
+                    if sliders >> second & 1:
+                        pins[first] = ray ^ rays[second]
+        for table, piece in ((KNIGHT_ATTACKS, opp + 'n'), (PAWN_ATTACKS[color], opp + 'p')):
+            for sq in iter_squares(table[ksq] & bb[piece]):
+                checkers.append(sq)
+                block |= 1 << sq
+        return kr, kc, checkers, block, pins
+
+    def _king_danger(self, kr, kc):
+        """Mask of squares the enemy controls, with the king lifted off the board."""
+        opp = 'b' if self.white_to_move else 'w'
+        bb = self.bitboards
+        occupied = (self.occupancy['w'] | self.occupancy['b']) ^ (1 << (kr * 8 + kc))
+        attacked = 0
+        for table, piece in ((KNIGHT_ATTACKS, opp + 'n'), (KING_ATTACKS, opp + 'k'), (PAWN_ATTACKS[opp], opp + 'p')):
+            for sq in iter_squares(bb[piece]):
+                attacked |= table[sq]
+        for attacks, piece in ((bishop_attacks, opp + 'b'), (rook_attacks, opp + 'r'), (queen_attacks, opp + 'q')):
+            for sq in iter_squares(bb[piece]):
+                attacked |= attacks(sq, occupied)
+        return attacked
+
+    def _legal_among(self, moves, kr, kc, checkers, block, pins, attacked):
+        ksq = kr * 8 + kc
+        legal_moves = []
+        for mv in moves:
+            start, end = mv.move_id & 0x3F, mv.move_id >> 6
+            if start == ksq:
+                if not attacked >> end & 1:
+                    legal_moves.append(mv)
+            elif mv.is_enpassant_move:
+                if self._enpassant_is_legal(ksq, start, end, mv.enpassant_pawn_location):
+                    legal_moves.append(mv)
+            elif not (checkers and not block >> end & 1) and not (start in pins and not pins[start] >> end & 1):
+                legal_moves.append(mv)
+        return legal_moves
+
+    def _enpassant_is_legal(self, ksq, start, end, captured):
+        # the capture empties two squares on one rank, so look for attackers on the new occupancy
+        opp = 'b' if self.white_to_move else 'w'
+        bb = self.bitboards
+        captured_bit = 1 << (captured[0] * 8 + captured[1])
+        if KNIGHT_ATTACKS[ksq] & bb[opp + 'n']:
+            return False
+        if PAWN_ATTACKS['w' if opp == 'b' else 'b'][ksq] & bb[opp + 'p'] & ~captured_bit:
+            return False
+        occupied = (self.occupancy['w'] | self.occupancy['b']) ^ (1 << start) ^ captured_bit | (1 << end)
+        queens = bb[opp + 'q']
+        if rook_attacks(ksq, occupied) & (bb[opp + 'r'] | queens):
+            return False
+        return not bishop_attacks(ksq, occupied) & (bb[opp + 'b'] | queens)
+
+    def _legal_castles(self, kr, kc, attacked):
+        castles = []
+        rights = (0, 1) if self.white_to_move else (2, 3)
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        base = kr * 8
+        if self.castling_rights[rights[0]] and not (occupied | attacked) & (0b11 << (base + 5)):
+            castles.append(Move((kr, kc), (kr, 6), self.board, is_castle_move=True))
+        if (self.castling_rights[rights[1]] and not occupied & (0b111 << (base + 1))
+                and not attacked & (0b11 << (base + 2))):
+            castles.append(Move((kr, kc), (kr, 2), self.board, is_castle_move=True))
+        return castles
+
+    def _piece_moves(self, r, c, moves):
+        board = self.board
+        color, ptype = board[r][c]
+        sq = r * 8 + c
+        own = self.occupancy[color]
+        enemy = self.occupancy['b' if color == 'w' else 'w']
+        occupied = own | enemy
+        if ptype == 'p':
+            step = -8 if color == 'w' else 8
+            to = sq + step
+            if not occupied >> to & 1:
+                moves.append(Move((r, c), SQUARES[to], board))
+                if r == (6 if color == 'w' else 1) and not occupied >> (to + step) & 1:
+                    moves.append(Move((r, c), SQUARES[to + step], board))
+            for to in iter_squares(PAWN_ATTACKS[color][sq] & enemy):
+                moves.append(Move((r, c), SQUARES[to], board))
+            if self.enpassant_target:
+                ep_r, ep_c = self.enpassant_target
+                if PAWN_ATTACKS[color][sq] >> (ep_r * 8 + ep_c) & 1:
+                    moves.append(Move((r, c), (ep_r, ep_c), board,
+                                      is_enpassant_move=True, enpassant_pawn_location=(r, ep_c)))
+            return
+        if ptype == 'n':
+            targets = KNIGHT_ATTACKS[sq]
+        elif ptype == 'k':
+            targets = KING_ATTACKS[sq]
+        elif ptype == 'b':
+            targets = bishop_attacks(sq, occupied)
+        elif ptype == 'r':
+            targets = rook_attacks(sq, occupied)
+        else:
+            targets = queen_attacks(sq, occupied)
+        for to in iter_squares(targets & ~own):
+            moves.append(Move((r, c), SQUARES[to], board))
+
+    def get_all_possible_moves_for_color(self, color, for_attack_only=False):
+        moves = []
+        board = self.board
+        bb = self.bitboards
+        own = self.occupancy[color]
+        enemy = self.occupancy['b' if color == 'w' else 'w']
+        empty = ~(own | enemy) & 0xFFFFFFFFFFFFFFFF
+        occupied = own | enemy
+
+        pawns = bb[color + 'p']
+        if color == 'w':
+            single = (pawns >> 8) & empty
+            double = ((single & 0x0000FF0000000000) >> 8) & empty
+            step = 8
+        else:
+            single = (pawns << 8) & empty & 0xFFFFFFFFFFFFFFFF
+            double = ((single & 0x0000000000FF0000) << 8) & empty
+            step = -8
+        for to in iter_squares(single):
+            moves.append(Move(SQUARES[to + step], SQUARES[to], board))
+        for to in iter_squares(double):
+            moves.append(Move(SQUARES[to + 2 * step], SQUARES[to], board))
+        pawn_attacks = PAWN_ATTACKS[color]
+        for sq in iter_squares(pawns):
+            for to in iter_squares(pawn_attacks[sq] & enemy):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        if self.enpassant_target:
+            ep_r, ep_c = self.enpassant_target
+            ep_sq = ep_r * 8 + ep_c
+            for sq in iter_squares(PAWN_ATTACKS['b' if color == 'w' else 'w'][ep_sq] & pawns):
+                r = sq // 8
+                moves.append(Move(SQUARES[sq], (ep_r, ep_c), board,
+                                  is_enpassant_move=True, enpassant_pawn_location=(r, ep_c)))
+
+        not_own = ~own
+        for sq in iter_squares(bb[color + 'n']):
+            for to in iter_squares(KNIGHT_ATTACKS[sq] & not_own):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for sq in iter_squares(bb[color + 'b']):
+            for to in iter_squares(bishop_attacks(sq, occupied) & not_own):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for sq in iter_squares(bb[color + 'r']):
+            for to in iter_squares(rook_attacks(sq, occupied) & not_own):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for sq in iter_squares(bb[color + 'q']):
+            for to in iter_squares(queen_attacks(sq, occupied) & not_own):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for sq in iter_squares(bb[color + 'k']):
+            for to in iter_squares(KING_ATTACKS[sq] & not_own):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+            if not for_attack_only:
+                self._get_castle_moves(sq, color, occupied, moves)
+        return moves
+
+    def generate_pseudo_move_stages(self):
+        color = 'w' if self.white_to_move else 'b'
+        board = self.board
+        bb = self.bitboards
+        own = self.occupancy[color]
+        enemy = self.occupancy['b' if color == 'w' else 'w']
+        empty = ~(own | enemy) & 0xFFFFFFFFFFFFFFFF
+        occupied = own | enemy
+        pawns = bb[color + 'p']
+        if color == 'w':
+            single = (pawns >> 8) & empty
+            step, last_row = 8, 0x00000000000000FF
+        else:
+            single = (pawns << 8) & empty & 0xFFFFFFFFFFFFFFFF
+            step, last_row = -8, 0xFF00000000000000
+        pieces = [(KNIGHT_ATTACKS, bb[color + 'n']), (KING_ATTACKS, bb[color + 'k'])]
+        sliders = [(bishop_attacks, bb[color + 'b']), (rook_attacks, bb[color + 'r']),
+                   (queen_attacks, bb[color + 'q'])]
+
+        # captures, en passant and pushes onto the last row
+        moves = []
+        for to in iter_squares(single & last_row):
+            moves.append(Move(SQUARES[to + step], SQUARES[to], board))
+        pawn_attacks = PAWN_ATTACKS[color]
+        for sq in iter_squares(pawns):
+            for to in iter_squares(pawn_attacks[sq] & enemy):
+                moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        if self.enpassant_target:
+            ep_r, ep_c = self.enpassant_target
+            for sq in iter_squares(PAWN_ATTACKS['b' if color == 'w' else 'w'][ep_r * 8 + ep_c] & pawns):
+                moves.append(Move(SQUARES[sq], (ep_r, ep_c), board,
+                                  is_enpassant_move=True, enpassant_pawn_location=(sq // 8, ep_c)))
+        for table, piece_bb in pieces:
+            for sq in iter_squares(piece_bb):
+                for to in iter_squares(table[sq] & enemy):
+                    moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for attacks, piece_bb in sliders:
+            for sq in iter_squares(piece_bb):
+                for to in iter_squares(attacks(sq, occupied) & enemy):
+                    moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        yield moves
+
+        moves = []
+        single &= ~last_row
+        if color == 'w':
+            double = ((single & 0x0000FF0000000000) >> 8) & empty
+        else:
+            double = ((single & 0x0000000000FF0000) << 8) & empty
+        for to in iter_squares(single):
+            moves.append(Move(SQUARES[to + step], SQUARES[to], board))
+        for to in iter_squares(double):
+            moves.append(Move(SQUARES[to + 2 * step], SQUARES[to], board))
+        for table, piece_bb in pieces:
+            for sq in iter_squares(piece_bb):
+                for to in iter_squares(table[sq] & empty):
+                    moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        for attacks, piece_bb in sliders:
+            for sq in iter_squares(piece_bb):
+                for to in iter_squares(attacks(sq, occupied) & empty):
+                    moves.append(Move(SQUARES[sq], SQUARES[to], board))
+        yield moves
+
+    def _get_castle_moves(self, sq, color, occupied, moves):
+        row = 7 if color == 'w' else 0
+        if sq != row * 8 + 4:
+            return
+        opp = 'b' if color == 'w' else 'w'
+        kingside, queenside = (0, 1) if color == 'w' else (2, 3)
+        if not (self.castling_rights[kingside] or self.castling_rights[queenside]):
+            return
+        if self.attackers_exist(sq, opp):
+            return
+        base = row * 8
+        if (self.castling_rights[kingside] and not occupied & (0b11 << (base + 5))
+                and not self.attackers_exist(base + 5, opp) and not self.attackers_exist(base + 6, opp)):
+            moves.append(Move((row, 4), (row, 6), self.board, is_castle_move=True))
+        if (self.castling_rights[queenside] and not occupied & (0b111 << (base + 1))
+                and not self.attackers_exist(base + 2, opp) and not self.attackers_exist(base + 3, opp)):
+            moves.append(Move((row, 4), (row, 2), self.board, is_castle_move=True))
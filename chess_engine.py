@@ -1,15 +1,42 @@
 # chess_engine.py
 """
 Full chess engine:
-- legal move generation (no leaving king in check)
-- castling, en passant, promotion (flag only)
+- legal move generation from checkers, pins and attacked squares (no make/undo filtering)
+- castling, en passant, promotion (flagged by make_move, resolved by promote_pawn)
 - check/checkmate/stalemate detection
-- draw detection: insufficient material and 50-move rule
+- draw detection: insufficient material, 50-move rule and threefold repetition
+- incremental Zobrist position keys
 - undo with full state restoration (castling rights, enpassant, halfmove clock, king positions)
-- recursion-safe attack detection
+- direct attack detection (rays, knight, pawn and king offsets from the target square)
+- FEN import/export and perft/divide node counting
+- incrementally maintained piece squares per color and piece counts per type
+- LRU cache of legal moves and check/mate/stalemate flags keyed by Zobrist key
+- staged lazy generation (hash move, captures, quiet moves, castling) and a has_legal_move()
+  check that stops at the first legal move
 """
 
-from copy import deepcopy
+import random
+from collections import OrderedDict
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1),
+                (0, -1),           (0, 1),
+                (1, -1),  (1, 0),  (1, 1))
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+MOVE_CACHE_SIZE = 4096  # positions kept by each GameState's legal-move cache
+HALFMOVE_CLOCK_MAX = (1 << 20) - 1  # widest clock the per-ply undo record can hold
+
+# Zobrist keys, seeded so that position keys are stable across runs and processes
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_PIECES = {color + ptype: [_zobrist_rng.getrandbits(64) for _ in range(64)]
+                  for color in "wb" for ptype in "prnbqk"}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_rng.getrandbits(64) for _ in range(4)]
+ZOBRIST_ENPASSANT = [_zobrist_rng.getrandbits(64) for _ in range(8)]
 
 class GameState:
     def __init__(self):
@@ -25,15 +52,24 @@ class GameState:
         ]
         self.white_to_move = True
         self.move_log = []  # list of Move objects
+        self.undo_stack = []  # packed irreversible state, one int per move in move_log
         self.white_king_location = (7, 4)
         self.black_king_location = (0, 4)
         self.castling_rights = [True, True, True, True]  # [wks, wqs, bks, bqs]
         self.enpassant_target = None
         self.pawn_promotion = None
         self.halfmove_clock = 0
+        self.fullmove_number = 1
         self.check = False
         self.checkmate = False
         self.stalemate = False
+        self.zobrist_key = self.compute_zobrist_key()
+        self.repetition_counts = {self.zobrist_key: 1}
+        self.index_pieces()
+        self.move_cache = OrderedDict()  # zobrist key -> (legal moves, check, checkmate, stalemate)
+        self.move_cache_size = MOVE_CACHE_SIZE
+        self.move_cache_hits = 0
+        self.move_cache_misses = 0
 
         self.move_functions = {
             'p': self.get_pawn_moves,
@@ -45,11 +81,22 @@ class GameState:
         }
 
     def make_move(self, move):
-        move.prev_castling_rights = deepcopy(self.castling_rights)
-        move.prev_enpassant_target = deepcopy(self.enpassant_target)
-        move.prev_halfmove_clock = self.halfmove_clock
-        move.prev_white_king_location = self.white_king_location
-        move.prev_black_king_location = self.black_king_location
+        self.undo_stack.append(self._pack_irreversible_state())
+
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ self._zobrist_rights_key()
+        key ^= ZOBRIST_PIECES[move.piece_moved][move.start_row * 8 + move.start_col]
+        key ^= ZOBRIST_PIECES[move.piece_moved][move.end_row * 8 + move.end_col]
+        if move.piece_captured != "--":
+            if move.is_enpassant_move:
+                cap_r, cap_c = move.enpassant_pawn_location
+            else:
+                cap_r, cap_c = move.end_row, move.end_col
+            key ^= ZOBRIST_PIECES[move.piece_captured][cap_r * 8 + cap_c]
+            self.piece_squares[move.piece_captured[0]].discard((cap_r, cap_c))
+            self.piece_counts[move.piece_captured] -= 1
+        own_squares = self.piece_squares[move.piece_moved[0]]
+        own_squares.discard((move.start_row, move.start_col))
+        own_squares.add((move.end_row, move.end_col))
 
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_moved
@@ -102,16 +149,18 @@ class GameState:
             row = move.start_row
             self.board[row][rook_end_col] = self.board[row][rook_start_col]
             self.board[row][rook_start_col] = "--"
+            rook_keys = ZOBRIST_PIECES[move.piece_moved[0] + 'r']
+            key ^= rook_keys[row * 8 + rook_start_col] ^ rook_keys[row * 8 + rook_end_col]
+            own_squares.discard((row, rook_start_col))
+            own_squares.add((row, rook_end_col))
 
         self.pawn_promotion = None
         if move.piece_moved[1] == 'p':
             self.halfmove_clock = 0
             if move.piece_moved[0] == 'w' and move.end_row == 0:
                 self.pawn_promotion = ('w', move.end_row, move.end_col)
-                move.is_promotion = True
             elif move.piece_moved[0] == 'b' and move.end_row == 7:
                 self.pawn_promotion = ('b', move.end_row, move.end_col)
-                move.is_promotion = True
         else:
             if move.piece_captured != "--":
                 self.halfmove_clock = 0
@@ -119,19 +168,35 @@ class GameState:
                 self.halfmove_clock += 1
 
         self.move_log.append(move)
+        if not self.white_to_move:
+            self.fullmove_number += 1
         self.white_to_move = not self.white_to_move
+        self.zobrist_key = key ^ self._zobrist_rights_key()
+        self.repetition_counts[self.zobrist_key] = self.repetition_counts.get(self.zobrist_key, 0) + 1
 
     def undo_move(self):
         if not self.move_log:
             return
         move = self.move_log.pop()
-        
+        self._forget_position()
+        state = self.undo_stack.pop()
+
+        piece_at_end = self.board[move.end_row][move.end_col]
+        if piece_at_end != move.piece_moved:
+            self.piece_counts[piece_at_end] -= 1
+            self.piece_counts[move.piece_moved] += 1
+        own_squares = self.piece_squares[move.piece_moved[0]]
+        own_squares.discard((move.end_row, move.end_col))
+        own_squares.add((move.start_row, move.start_col))
         self.board[move.start_row][move.start_col] = move.piece_moved
         self.board[move.end_row][move.end_col] = move.piece_captured
-        
+
         if move.is_enpassant_move:
             self.board[move.end_row][move.end_col] = "--"
             self.board[move.enpassant_pawn_location[0]][move.enpassant_pawn_location[1]] = move.piece_captured
+        if move.piece_captured != "--":
+            self.piece_squares[move.piece_captured[0]].add(move.enpassant_pawn_location or (move.end_row, move.end_col))
+            self.piece_counts[move.piece_captured] += 1
 
         if move.is_castle_move:
             if move.end_col - move.start_col == 2:
@@ -141,43 +206,588 @@ class GameState:
             row = move.start_row
             self.board[row][rook_start_col] = self.board[row][rook_end_col]
             self.board[row][rook_end_col] = "--"
-            
-        if move.is_promotion:
-            self.board[move.start_row][move.start_col] = move.piece_moved[0] + 'p'
-
-        self.castling_rights = deepcopy(move.prev_castling_rights)
-        self.enpassant_target = deepcopy(move.prev_enpassant_target)
-        self.halfmove_clock = move.prev_halfmove_clock
-        self.white_king_location = move.prev_white_king_location
-        self.black_king_location = move.prev_black_king_location
+            own_squares.discard((row, rook_end_col))
+            own_squares.add((row, rook_start_col))
+
+        if move.piece_moved == 'wk':
+            self.white_king_location = (move.start_row, move.start_col)
+        elif move.piece_moved == 'bk':
+            self.black_king_location = (move.start_row, move.start_col)
+
+        self._unpack_irreversible_state(state)
         self.white_to_move = not self.white_to_move
+        if not self.white_to_move:
+            self.fullmove_number -= 1
+        self.pawn_promotion = None
+        self.checkmate = False
+        self.stalemate = False
+
+    def _pack_irreversible_state(self):
+        # one int per ply: castling bits 0-3, ep square + 1 in bits 4-10, check bit 11,
+        # halfmove clock in bits 12-31 and the Zobrist key above that
+        assert self.halfmove_clock >= 0
+        ep = self.enpassant_target
+        rights = self.castling_rights
+        # the clock saturates rather than spilling into the key; past 2^20 - 1 only "well over 50" matters
+        clock = min(self.halfmove_clock, HALFMOVE_CLOCK_MAX)
+        return (self.zobrist_key << 32 | clock << 12 | self.check << 11
+                | (ep[0] * 8 + ep[1] + 1 if ep else 0) << 4
+                | rights[0] | rights[1] << 1 | rights[2] << 2 | rights[3] << 3)
+
+    def _unpack_irreversible_state(self, state):
+        self.castling_rights = [bool(state & 1), bool(state & 2), bool(state & 4), bool(state & 8)]
+        ep = (state >> 4) & 0x7F
+        self.enpassant_target = divmod(ep - 1, 8) if ep else None
+        self.check = bool(state >> 11 & 1)
+        self.halfmove_clock = (state >> 12) & 0xFFFFF
+        self.zobrist_key = state >> 32
+
+    def promote_pawn(self, piece):
+        """Replace the pawn flagged in self.pawn_promotion by `piece` (e.g. "wq")."""
+        _, r, c = self.pawn_promotion
+        self._forget_position()
+        self.zobrist_key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c] ^ ZOBRIST_PIECES[piece][r * 8 + c]
+        self.repetition_counts[self.zobrist_key] = self.repetition_counts.get(self.zobrist_key, 0) + 1
+        self.piece_counts[self.board[r][c]] -= 1
+        self.piece_counts[piece] += 1
+        self.board[r][c] = piece
+        self.move_log[-1].promotion_piece = piece
+        self.pawn_promotion = None
+
+    def index_pieces(self):
+        """Rebuild the per-color piece squares and per-piece counts from self.board."""
+        self.piece_squares = {'w': set(), 'b': set()}
+        self.piece_counts = {color + ptype: 0 for color in "wb" for ptype in "prnbqk"}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.piece_squares[piece[0]].add((r, c))
+                    self.piece_counts[piece] += 1
+
+    def compute_zobrist_key(self):
+        """Hash the current position from scratch (make_move/undo_move keep self.zobrist_key up to date)."""
+        key = self._zobrist_rights_key()
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][r * 8 + c]
+        return key
+
+    def _zobrist_rights_key(self):
+        key = 0
+        for i in range(4):
+            if self.castling_rights[i]:
+                key ^= ZOBRIST_CASTLING[i]
+        if self.enpassant_target:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_target[1]]
+        return key
+
+    def _forget_position(self):
+        count = self.repetition_counts[self.zobrist_key] - 1
+        if count:
+            self.repetition_counts[self.zobrist_key] = count
+        else:
+            del self.repetition_counts[self.zobrist_key]
+
+    def is_threefold_repetition(self):
+        """True once the current position has occurred at least three times in this game."""
+        return self.repetition_counts.get(self.zobrist_key, 0) >= 3
+
+    def game_status(self):
+        """How the game stands, once get_valid_moves() or has_legal_move() has set the checkmate and
+        stalemate flags: "checkmate", "stalemate", "insufficient_material", "fifty_moves", "repetition"
+        or "ongoing"."""
+        if self.checkmate:
+            return "checkmate"
+        if self.stalemate:
+            return "stalemate"
+        if self.insufficient_material():
+            return "insufficient_material"
+        if self.halfmove_clock >= 100:
+            return "fifty_moves"
+        if self.is_threefold_repetition():
+            return "repetition"
+        return "ongoing"
+
+    @classmethod
+    def from_fen(cls, fen):
+        gs = cls()
+        gs.load_fen(fen)
+        return gs
+
+    def load_fen(self, fen):
+        """Set up the position described by a FEN string, discarding the current game.
+
+        Raises ValueError if the string is not a well-formed FEN with one king per side, has a
+        pawn on the first or last rank, claims a castling right whose king or rook has left
+        its home square, names an en passant square no double pawn push could have left, or
+        has a negative halfmove clock (or one too large to pack), or a fullmove number below 1.
+        """
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ("w", "b"):
+            raise ValueError("invalid FEN: " + fen)
+        placement, side = fields[0], fields[1]
+        castling = fields[2] if len(fields) > 2 else "-"
+        enpassant = fields[3] if len(fields) > 3 else "-"
+        board = []
+        kings = {}
+        for r, rank in enumerate(placement.split("/")):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch.lower() in "prnbqk":
+                    piece = ('w' if ch.isupper() else 'b') + ch.lower()
+                    if piece[1] == 'k':
+                        kings.setdefault(piece, []).append((r, len(row)))
+                    row.append(piece)
+                else:
+                    raise ValueError("invalid FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("invalid FEN: " + fen)
+            board.append(row)
+        if len(board) != 8 or len(kings.get('wk', ())) != 1 or len(kings.get('bk', ())) != 1:
+            raise ValueError("invalid FEN: " + fen)
+        if "wp" in board[0] + board[7] or "bp" in board[0] + board[7]:
+            raise ValueError("invalid FEN (pawn on the first or last rank): " + fen)
+        if castling != "-" and (not castling or any(flag not in "KQkq" or castling.count(flag) > 1
+                                                    for flag in castling)):
+            raise ValueError("invalid FEN: " + fen)
+        for flag, (row, rook_col) in zip("KQkq", ((7, 7), (7, 0), (0, 7), (0, 0))):
+            color = 'w' if row == 7 else 'b'
+            if flag in castling and (board[row][4] != color + 'k' or board[row][rook_col] != color + 'r'):
+                raise ValueError("invalid FEN (castling right %s without king and rook at home): %s" % (flag, fen))
+        if enpassant != "-":
+            if len(enpassant) != 2 or enpassant[0] not in Move.files_to_cols or enpassant[1] not in ("3", "6"):
+                raise ValueError("invalid FEN: " + fen)
+            # the square must be the one a double pawn push by the side not to move just crossed
+            ep_c = Move.files_to_cols[enpassant[0]]
+            row, origin, pawn_row, pawn = (2, 1, 3, "bp") if side == 'w' else (5, 6, 4, "wp")
+            if (Move.ranks_to_rows[enpassant[1]] != row or board[row][ep_c] != "--"
+                    or board[origin][ep_c] != "--" or board[pawn_row][ep_c] != pawn):
+                raise ValueError("invalid FEN (impossible en passant square): " + fen)
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("invalid FEN: " + fen) from None
+        if not 0 <= halfmove_clock <= HALFMOVE_CLOCK_MAX or fullmove_number < 1:
+            raise ValueError("invalid FEN (move counters out of range): " + fen)
+
+        self.board = board
+        self.white_king_location = kings['wk'][0]
+        self.black_king_location = kings['bk'][0]
+        self.white_to_move = side == 'w'
+        self.castling_rights = [flag in castling for flag in "KQkq"]
+        if enpassant == "-":
+            self.enpassant_target = None
+        else:
+            self.enpassant_target = (Move.ranks_to_rows[enpassant[1]], Move.files_to_cols[enpassant[0]])
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.move_log = []
+        self.undo_stack = []
+        self.index_pieces()
         self.pawn_promotion = None
         self.check = self.in_check()
         self.checkmate = False
         self.stalemate = False
+        self.zobrist_key = self.compute_zobrist_key()
+        self.repetition_counts = {self.zobrist_key: 1}
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = "".join(flag for flag, allowed in zip("KQkq", self.castling_rights) if allowed) or "-"
+        if self.enpassant_target:
+            enpassant = Move.cols_to_files[self.enpassant_target[1]] + Move.rows_to_ranks[self.enpassant_target[0]]
+        else:
+            enpassant = "-"
+        return " ".join(["/".join(ranks), "w" if self.white_to_move else "b", castling, enpassant,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def perft(self, depth):
+        """Count leaf nodes of the legal move tree, each promotion choice counted separately."""
+        if depth == 0:
+            return 1
+        # almost every node is new, so skip the move cache and measure generation itself
+        moves = self.generate_valid_moves()
+        if depth == 1:
+            return len(moves) + 3 * sum(1 for mv in moves if mv.is_promotion)
+        nodes = 0
+        for mv in moves:
+            for _, count in self._perft_children(mv, depth):
+                nodes += count
+        return nodes
+
+    def divide(self, depth):
+        """Per-root-move perft counts, keyed by coordinate notation (plus promotion letter)."""
+        result = {}
+        for mv in self.get_valid_moves():
+            for piece, count in self._perft_children(mv, depth):
+                result[mv.get_chess_notation() + (piece[1] if piece else "")] = count
+        return result
+
+    def _perft_children(self, move, depth):
+        self.make_move(move)
+        if not self.pawn_promotion:
+            count = self.perft(depth - 1)
+            self.undo_move()
+            return [(None, count)]
+        color = self.pawn_promotion[0]
+        self.undo_move()
+        counts = []
+        for p in "qrbn":
+            self.make_move(move)
+            self.promote_pawn(color + p)
+            counts.append((color + p, self.perft(depth - 1)))
+            self.undo_move()
+        return counts
 
     def get_valid_moves(self):
-        moves = self.get_all_possible_moves()
+        """Legal moves for the side to move; also sets check, checkmate and stalemate.
+
+        Results are cached per position, so the returned list is a fresh copy each time.
+        """
+        if self.pawn_promotion or not self.move_cache_size:
+            return self.generate_valid_moves()
+        cache = self.move_cache
+        entry = cache.get(self.zobrist_key)
+        if entry is not None:
+            cache.move_to_end(self.zobrist_key)
+            self.move_cache_hits += 1
+            moves, self.check, self.checkmate, self.stalemate = entry
+            return list(moves)
+        self.move_cache_misses += 1
+        moves = self.generate_valid_moves()
+        cache[self.zobrist_key] = (tuple(moves), self.check, self.checkmate, self.stalemate)
+        if len(cache) > self.move_cache_size:
+            cache.popitem(last=False)
+        return moves
+
+    def set_move_cache_size(self, size):
+        """Resize the legal-move cache (0 disables it), dropping the oldest entries if needed."""
+        self.move_cache_size = size
+        while len(self.move_cache) > size:
+            self.move_cache.popitem(last=False)
+
+    def clear_move_cache(self):
+        """Forget cached moves; needed only after editing self.board by hand."""
+        self.move_cache.clear()
+
+    def move_cache_stats(self):
+        lookups = self.move_cache_hits + self.move_cache_misses
+        return {"hits": self.move_cache_hits, "misses": self.move_cache_misses,
+                "entries": len(self.move_cache), "size": self.move_cache_size,
+                "hit_rate": self.move_cache_hits / lookups if lookups else 0.0}
+
+    def generate_valid_moves(self):
+        """Compute the legal moves from scratch, bypassing the cache."""
+        # checkers, pins and enemy-controlled squares are worked out once, then
+        # each pseudo-legal move is accepted or rejected without make/undo
+        kr, kc, checkers, block_squares, pins = self._move_constraints()
+        attacked = self._king_danger(kr, kc)
+
+        if len(checkers) > 1:
+            moves = []
+            self._piece_moves(kr, kc, moves)
+        else:
+            moves = self.get_all_possible_moves()
+
+        legal_moves = self._legal_among(moves, kr, kc, checkers, block_squares, pins, attacked)
+        self.check = bool(checkers)
+        self.checkmate = not legal_moves and self.check
+        self.stalemate = not legal_moves and not self.check
+        return legal_moves
+
+    def _move_constraints(self):
+        """(king row, king col, checkers, block squares, pins) for the side to move."""
+        ally = 'w' if self.white_to_move else 'b'
+        kr, kc = self.white_king_location if self.white_to_move else self.black_king_location
+        return (kr, kc) + self.get_checks_and_pins(kr, kc, ally)
+
+    def _king_danger(self, kr, kc):
+        """Squares the enemy controls, seen through the king on (kr, kc); read by _legal_among for king moves."""
+        return self.get_attacked_squares('b' if self.white_to_move else 'w', (kr, kc))
+
+    def _legal_among(self, moves, kr, kc, checkers, block_squares, pins, attacked):
+        """The legal moves among pseudo-legal `moves` (attacked is only read for king moves)."""
         legal_moves = []
         for mv in moves:
-            self.make_move(mv)
-            self.white_to_move = not self.white_to_move
-            if not self.in_check():
-                legal_moves.append(mv)
-            self.white_to_move = not self.white_to_move
-            self.undo_move()
-            
-        if not legal_moves:
-            if self.in_check():
-                self.checkmate = True
+            if mv.start_row == kr and mv.start_col == kc:
+                if (mv.end_row, mv.end_col) not in attacked:
+                    legal_moves.append(mv)
+            elif mv.is_enpassant_move:
+                # the capture empties two squares on one rank, so test it directly
+                self.make_move(mv)
+                self.white_to_move = not self.white_to_move
+                if not self.in_check():
+                    legal_moves.append(mv)
+                self.white_to_move = not self.white_to_move
+                self.undo_move()
             else:
-                self.stalemate = True
+                if checkers and (mv.end_row, mv.end_col) not in block_squares:
+                    continue
+                pin = pins.get((mv.start_row, mv.start_col))
+                if pin and (mv.end_row - mv.start_row) * pin[1] != (mv.end_col - mv.start_col) * pin[0]:
+                    continue
+                legal_moves.append(mv)
+        return legal_moves
+
+    def has_legal_move(self):
+        """True if the side to move has at least one legal move; also sets check, checkmate and
+        stalemate. Stops at the first legal move instead of generating them all."""
+        cached = self.move_cache_size and not self.pawn_promotion
+        entry = self.move_cache.get(self.zobrist_key) if cached else None
+        if entry is not None:
+            self.move_cache.move_to_end(self.zobrist_key)
+            self.move_cache_hits += 1
+            self.check, self.checkmate, self.stalemate = entry[1:]
+            return not (self.checkmate or self.stalemate)
+        if cached:
+            self.move_cache_misses += 1
+        kr, kc, checkers, block_squares, pins = self._move_constraints()
+        self.check = bool(checkers)
+        self.checkmate = self.stalemate = False
+        ally = 'w' if self.white_to_move else 'b'
+        if len(checkers) < 2:
+            # pieces other than the king don't need the enemy's attack map
+            for r, c in list(self.piece_squares[ally]):
+                if (r, c) == (kr, kc):
+                    continue
+                moves = []
+                self._piece_moves(r, c, moves)
+                if self._legal_among(moves, kr, kc, checkers, block_squares, pins, None):
+                    return True
+        moves = []
+        self._piece_moves(kr, kc, moves)
+        if moves:
+            # castling is never the only legal move: the king could step one square instead
+            attacked = self._king_danger(kr, kc)
+            if self._legal_among(moves, kr, kc, checkers, block_squares, pins, attacked):
+                return True
+        self.checkmate = self.check
+        self.stalemate = not self.check
+        return False
+
+    def legal_move_stages(self, hash_move=None):
+        """Yield the legal moves lazily as (stage, moves) pairs, in the order "hash", "captures"
+        (captures, en passant and promotions), "quiet" and "castling".
+
+        `hash_move` is a Move.encode() value to try first (if legal, it is the whole "hash" stage
+        and is left out of the later ones). Each stage is generated only when the consumer asks
+        for it, so a search that cuts off on a capture never builds the quiet moves. Sets check
+        on entry; once every stage has been consumed, checkmate, stalemate and the move cache are
+        updated as by get_valid_moves().
+        """
+        cached = self.move_cache_size and not self.pawn_promotion
+        entry = self.move_cache.get(self.zobrist_key) if cached else None
+        if entry is not None:
+            self.move_cache.move_to_end(self.zobrist_key)
+            self.move_cache_hits += 1
+            self.check, self.checkmate, self.stalemate = entry[1:]
+            stages = {"hash": [], "captures": [], "quiet": [], "castling": []}
+            hash_id = hash_move & 0xFFF if hash_move is not None else None
+            for mv in entry[0]:
+                if mv.move_id == hash_id:
+                    stages["hash"].append(mv)
+                elif mv.is_castle_move:
+                    stages["castling"].append(mv)
+                elif mv.piece_captured != "--" or mv.is_promotion:
+                    stages["captures"].append(mv)
+                else:
+                    stages["quiet"].append(mv)
+            yield from stages.items()
+            return
+        if cached:
+            self.move_cache_misses += 1
+
+        kr, kc, checkers, block_squares, pins = self._move_constraints()
+        self.check = bool(checkers)
+        attacked = None
+        found = []
+
+        hash_id = None
+        if hash_move is not None and len(checkers) < 2:
+            hash_id = hash_move & 0xFFF
+            r, c = divmod(hash_id & 0x3F, 8)
+            piece = self.board[r][c]
+            candidates = []
+            if piece[0] == ('w' if self.white_to_move else 'b'):
+                # only the hashed piece's moves are generated to check the hash move
+                self._piece_moves(r, c, candidates)
+                if piece[1] == 'k':
+                    attacked = self._king_danger(kr, kc)
+            candidates = [mv for mv in candidates if mv.move_id == hash_id]
+            legal = self._legal_among(candidates, kr, kc, checkers, block_squares, pins, attacked)
+            found.extend(legal)
+            yield "hash", legal
+            if not legal:
+                hash_id = None
         else:
-            self.checkmate = False
-            self.stalemate = False
+            yield "hash", []
 
-        self.check = self.in_check()
-        return legal_moves
+        if len(checkers) > 1:
+            king_moves = []
+            self._piece_moves(kr, kc, king_moves)
+            stages = self._split_tactical(king_moves)
+        else:
+            stages = self.generate_pseudo_move_stages()
+        for stage, moves in zip(("captures", "quiet"), stages):
+            if hash_id is not None:
+                moves = [mv for mv in moves if mv.move_id != hash_id]
+            if attacked is None and any(mv.start_row == kr and mv.start_col == kc for mv in moves):
+                attacked = self._king_danger(kr, kc)
+            legal = self._legal_among(moves, kr, kc, checkers, block_squares, pins, attacked)
+            found.extend(legal)
+            yield stage, legal
+
+        castles = []
+        rights = (0, 1) if self.white_to_move else (2, 3)
+        if not checkers and (kr, kc) == ((7, 4) if self.white_to_move else (0, 4)):
+            if self.castling_rights[rights[0]] or self.castling_rights[rights[1]]:
+                if attacked is None:
+                    attacked = self._king_danger(kr, kc)
+                castles = self._legal_castles(kr, kc, attacked)
+        found.extend(castles)
+        yield "castling", castles
+
+        self.checkmate = not found and self.check
+        self.stalemate = not found and not self.check
+        if cached:
+            self.move_cache[self.zobrist_key] = (tuple(found), self.check, self.checkmate, self.stalemate)
+            if len(self.move_cache) > self.move_cache_size:
+                self.move_cache.popitem(last=False)
+
+    def _legal_castles(self, kr, kc, attacked):
+        """Castling moves for a king on its home square and not in check, given _king_danger()."""
+        castles = []
+        rights = (0, 1) if self.white_to_move else (2, 3)
+        row = self.board[kr]
+        if (self.castling_rights[rights[0]] and row[5] == row[6] == "--"
+                and (kr, 5) not in attacked and (kr, 6) not in attacked):
+            castles.append(Move((kr, kc), (kr, 6), self.board, is_castle_move=True))
+        if (self.castling_rights[rights[1]] and row[1] == row[2] == row[3] == "--"
+                and (kr, 2) not in attacked and (kr, 3) not in attacked):
+            castles.append(Move((kr, kc), (kr, 2), self.board, is_castle_move=True))
+        return castles
+
+    def iter_legal_moves(self, hash_move=None):
+        """Legal moves one at a time, in legal_move_stages() order."""
+        for _, moves in self.legal_move_stages(hash_move):
+            yield from moves
+
+    @staticmethod
+    def _split_tactical(moves):
+        captures, quiets = [], []
+        for mv in moves:
+            if mv.piece_captured != "--" or mv.is_promotion:
+                captures.append(mv)
+            else:
+                quiets.append(mv)
+        return captures, quiets
+
+    def generate_pseudo_move_stages(self):
+        """Yield the side to move's pseudo-legal moves, castling left out, as two lists:
+        captures (with en passant and promotions), then quiet moves."""
+        ally = 'w' if self.white_to_move else 'b'
+        moves = []
+        for r, c in self.piece_squares[ally]:
+            self._piece_moves(r, c, moves)
+        yield from self._split_tactical(moves)
+
+    def _piece_moves(self, r, c, moves):
+        """Append the pseudo-legal moves of the piece on (r, c), castling left out."""
+        ptype = self.board[r][c][1]
+        if ptype == 'k':
+            self.get_king_moves(r, c, moves, for_attack_only=True)
+        else:
+            self.move_functions[ptype](r, c, moves)
+
+    def get_checks_and_pins(self, kr, kc, ally):
+        """Return (checker squares, squares that resolve a single check, {pinned square: pin direction})."""
+        enemy = 'b' if ally == 'w' else 'w'
+        checkers = []
+        block_squares = set()
+        pins = {}
+        for dr, dc in ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)):
+            sliders = ('r', 'q') if dr == 0 or dc == 0 else ('b', 'q')
+            pinned = None
+            ray = []
+            rr, cc = kr + dr, kc + dc
+            while 0 <= rr < 8 and 0 <= cc < 8:
+                piece = self.board[rr][cc]
+                ray.append((rr, cc))
+                if piece != "--":
+                    if piece[0] == ally:
+                        if pinned:
+                            break
+                        pinned = (rr, cc)
+                    else:
+                        if piece[1] in sliders:
+                            if pinned:
+                                pins[pinned] = (dr, dc)
+                            else:
+                                checkers.append((rr, cc))
+                                block_squares.update(ray)
+                        break
+                rr, cc = rr + dr, cc + dc
+        for dr, dc in KNIGHT_OFFSETS:
+            rr, cc = kr + dr, kc + dc
+            if 0 <= rr < 8 and 0 <= cc < 8 and self.board[rr][cc] == enemy + 'n':
+                checkers.append((rr, cc))
+                block_squares.add((rr, cc))
+        pawn_row = kr - 1 if ally == 'w' else kr + 1
+        for cc in (kc - 1, kc + 1):
+            if 0 <= pawn_row < 8 and 0 <= cc < 8 and self.board[pawn_row][cc] == enemy + 'p':
+                checkers.append((pawn_row, cc))
+                block_squares.add((pawn_row, cc))
+        return checkers, block_squares, pins
+
+    def get_attacked_squares(self, color, transparent=None):
+        """Squares controlled by `color`; sliders see through the `transparent` square (the defending king)."""
+        attacked = set()
+        for r, c in self.piece_squares[color]:
+            ptype = self.board[r][c][1]
+            if ptype == 'p':
+                rr = r - 1 if color == 'w' else r + 1
+                if 0 <= rr < 8:
+                    if c > 0:
+                        attacked.add((rr, c - 1))
+                    if c < 7:
+                        attacked.add((rr, c + 1))
+            elif ptype == 'n' or ptype == 'k':
+                for dr, dc in (KNIGHT_OFFSETS if ptype == 'n' else KING_OFFSETS):
+                    rr, cc = r + dr, c + dc
+                    if 0 <= rr < 8 and 0 <= cc < 8:
+                        attacked.add((rr, cc))
+            else:
+                directions = ROOK_DIRECTIONS if ptype == 'r' else BISHOP_DIRECTIONS if ptype == 'b' else KING_OFFSETS
+                for dr, dc in directions:
+                    rr, cc = r + dr, c + dc
+                    while 0 <= rr < 8 and 0 <= cc < 8:
+                        attacked.add((rr, cc))
+                        if self.board[rr][cc] != "--" and (rr, cc) != transparent:
+                            break
+                        rr, cc = rr + dr, cc + dc
+        return attacked
 
     def in_check(self):
         if self.white_to_move:
@@ -187,27 +797,47 @@ class GameState:
         return self.square_under_attack(kr, kc)
 
     def square_under_attack(self, r, c):
-        opp_color = 'b' if self.white_to_move else 'w'
-        for move in self.get_all_possible_moves_for_color(opp_color, for_attack_only=True):
-            if move.end_row == r and move.end_col == c:
+        # look outwards from the square for an attacker instead of generating the opponent's moves
+        enemy = 'b' if self.white_to_move else 'w'
+        board = self.board
+        for dr, dc in KNIGHT_OFFSETS:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < 8 and 0 <= cc < 8 and board[rr][cc] == enemy + 'n':
+                return True
+        for dr, dc in KING_OFFSETS:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < 8 and 0 <= cc < 8 and board[rr][cc] == enemy + 'k':
                 return True
+        pawn_row = r + 1 if enemy == 'w' else r - 1
+        if 0 <= pawn_row < 8:
+            if (c > 0 and board[pawn_row][c - 1] == enemy + 'p') or (c < 7 and board[pawn_row][c + 1] == enemy + 'p'):
+                return True
+        for dr, dc in KING_OFFSETS:
+            sliders = ('r', 'q') if dr == 0 or dc == 0 else ('b', 'q')
+            rr, cc = r + dr, c + dc
+            while 0 <= rr < 8 and 0 <= cc < 8:
+                piece = board[rr][cc]
+                if piece != "--":
+                    if piece[0] == enemy and piece[1] in sliders:
+                        return True
+                    break
+                rr, cc = rr + dr, cc + dc
         return False
-        
+
     def get_all_possible_moves_for_color(self, color, for_attack_only=False):
         moves = []
         original_side = self.white_to_move
         self.white_to_move = (color == 'w')
 
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece != "--" and piece[0] == color:
-                    ptype = piece[1]
-                    if ptype == 'k':
-                        self.get_king_moves(r, c, moves, for_attack_only=for_attack_only)
-                    else:
-                        self.move_functions[ptype](r, c, moves)
-        
+        for r, c in self.piece_squares[color]:
+            ptype = self.board[r][c][1]
+            if ptype == 'k':
+                self.get_king_moves(r, c, moves, for_attack_only=for_attack_only)
+            elif ptype == 'p' and for_attack_only:
+                self.get_pawn_attacks(r, c, moves)
+            else:
+                self.move_functions[ptype](r, c, moves)
+
         self.white_to_move = original_side
         return moves
 
@@ -240,10 +870,16 @@ class GameState:
                 captured_pawn_loc = (r, ep_c)
                 moves.append(Move((r, c), (ep_r, ep_c), self.board, is_enpassant_move=True, enpassant_pawn_location=captured_pawn_loc))
 
+    def get_pawn_attacks(self, r, c, moves):
+        # diagonal squares a pawn controls, whether or not anything stands there
+        direction = -1 if self.board[r][c][0] == 'w' else 1
+        for cc in (c - 1, c + 1):
+            if 0 <= r + direction < 8 and 0 <= cc < 8:
+                moves.append(Move((r, c), (r + direction, cc), self.board))
+
     def get_rook_moves(self, r, c, moves):
-        directions = [(-1, 0), (0, -1), (1, 0), (0, 1)]
         ally = 'w' if self.white_to_move else 'b'
-        for dr, dc in directions:
+        for dr, dc in ROOK_DIRECTIONS:
             for i in range(1, 8):
                 rr, cc = r + dr * i, c + dc * i
                 if 0 <= rr < 8 and 0 <= cc < 8:
@@ -258,10 +894,8 @@ class GameState:
                     break
 
     def get_knight_moves(self, r, c, moves):
-        knight_offsets = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                          (1, -2), (1, 2), (2, -1), (2, 1)]
         ally = 'w' if self.white_to_move else 'b'
-        for dr, dc in knight_offsets:
+        for dr, dc in KNIGHT_OFFSETS:
             rr, cc = r + dr, c + dc
             if 0 <= rr < 8 and 0 <= cc < 8:
                 target = self.board[rr][cc]
@@ -269,9 +903,8 @@ class GameState:
                     moves.append(Move((r, c), (rr, cc), self.board))
 
     def get_bishop_moves(self, r, c, moves):
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
         ally = 'w' if self.white_to_move else 'b'
-        for dr, dc in directions:
+        for dr, dc in BISHOP_DIRECTIONS:
             for i in range(1, 8):
                 rr, cc = r + dr * i, c + dc * i
                 if 0 <= rr < 8 and 0 <= cc < 8:
@@ -291,10 +924,7 @@ class GameState:
 
     def get_king_moves(self, r, c, moves, for_attack_only=False):
         ally = 'w' if self.white_to_move else 'b'
-        king_offsets = [(-1, -1), (-1, 0), (-1, 1),
-                        (0, -1),           (0, 1),
-                        (1, -1),  (1, 0),  (1, 1)]
-        for dr, dc in king_offsets:
+        for dr, dc in KING_OFFSETS:
             rr, cc = r + dr, c + dc
             if 0 <= rr < 8 and 0 <= cc < 8:
                 target = self.board[rr][cc]
@@ -322,20 +952,20 @@ class GameState:
                         moves.append(Move((r, c), (0, 2), self.board, is_castle_move=True))
 
     def insufficient_material(self):
-        pieces = []
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece != "--":
-                    pieces.append(piece)
-        nonkings = [p for p in pieces if p[1] != 'k']
-        if not nonkings:
-            return True
-        if len(nonkings) == 1 and nonkings[0][1] in ('n', 'b'):
-            return True
-        return False
+        counts = self.piece_counts
+        if counts['wp'] or counts['bp'] or counts['wr'] or counts['br'] or counts['wq'] or counts['bq']:
+            return False
+        return counts['wn'] + counts['bn'] + counts['wb'] + counts['bb'] <= 1
+
+# promotion piece type <-> 3-bit code used by Move.encode
+PROMOTION_CODES = {None: 0, 'n': 1, 'b': 2, 'r': 3, 'q': 4}
+PROMOTION_TYPES = (None, 'n', 'b', 'r', 'q')
 
 class Move:
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_captured",
+                 "enpassant_pawn_location", "is_enpassant_move", "is_castle_move", "is_promotion",
+                 "promotion_piece", "move_id")
+
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
                      "5": 3, "6": 2, "7": 1, "8": 0}
     rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
@@ -357,20 +987,35 @@ class Move:
             self.enpassant_pawn_location = None
         self.is_enpassant_move = is_enpassant_move
         self.is_castle_move = is_castle_move
-        self.is_promotion = False
-        self.prev_castling_rights = None
-        self.prev_enpassant_target = None
-        self.prev_halfmove_clock = None
-        self.prev_white_king_location = None
-        self.prev_black_king_location = None
-        self.move_id = (self.start_row * 1000 + self.start_col * 100 +
-                        self.end_row * 10 + self.end_col)
+        self.is_promotion = self.piece_moved[1] == 'p' and self.end_row in (0, 7)
+        self.promotion_piece = None
+        # from square in bits 0-5, to square in bits 6-11
+        self.move_id = self.start_row * 8 + self.start_col | (self.end_row * 8 + self.end_col) << 6
 
     def __eq__(self, other):
         return isinstance(other, Move) and self.move_id == other.move_id
 
+    def __hash__(self):
+        return self.move_id
+
+    def encode(self, promotion=None):
+        """Pack into one int: from/to squares (bits 0-11), en passant/castle/promotion flags
+        (bits 12-14) and the promotion piece type (bits 15-17, see PROMOTION_CODES)."""
+        return (self.move_id | self.is_enpassant_move << 12 | self.is_castle_move << 13
+                | self.is_promotion << 14 | PROMOTION_CODES[promotion] << 15)
+
+    @classmethod
+    def decode(cls, code, board):
+        """Rebuild a Move for `board` from an encode() value; returns (move, promotion type)."""
+        start, end = divmod(code & 0x3F, 8), divmod(code >> 6 & 0x3F, 8)
+        if code >> 12 & 1:
+            move = cls(start, end, board, is_enpassant_move=True, enpassant_pawn_location=(start[0], end[1]))
+        else:
+            move = cls(start, end, board, is_castle_move=bool(code >> 13 & 1))
+        return move, PROMOTION_TYPES[code >> 15 & 7]
+
     def get_chess_notation(self):
         return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
 
     def get_rank_file(self, r, c):
-        return self.cols_to_files[c] + self.rows_to_ranks[r]
\ No newline at end of file
+        return self.cols_to_files[c] + self.rows_to_ranks[r]
@@ -0,0 +1,353 @@
+"""
+Compact binary position datasets for training and analysis.
+- one fixed-width 40-byte little-endian record per position: the board at 4 bits per square,
+  side to move and castling rights, en passant square, halfmove clock, result (white's point of
+  view), fullmove number and the move played (from | to << 6 | promotion code << 12)
+- positions come from PGN files, self-play matches or any start FEN plus Move.encode codes
+- DatasetWriter packs records with struct and writes them in large buffered chunks; the file is
+  written under a temporary name and renamed when complete
+- Dataset maps the file with mmap for random access without numpy; array() exposes it as a
+  zero-copy numpy.memmap and batches() yields shuffled batches; numpy is only needed for those
+- to_planes() and to_position_batch() decode batches for vectorized.py or model training
+
+Usage: python dataset.py export games.pgn out.bin [--plies-from N]
+       python dataset.py selfplay out.bin PLAYER_A PLAYER_B [--games N] [--workers N]
+       python dataset.py info out.bin [--sample N]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from bitboard import PIECES, BitboardGameState
+from chess_engine import PROMOTION_CODES, PROMOTION_TYPES, STARTING_FEN, Move
+from pgn import SanError, parse_san, read_games
+
+MAGIC = b"CHESSDS1"
+HEADER = struct.Struct("<8sQ")  # magic, record count
+RECORD = struct.Struct("<32sBBBbHH")  # board, flags, ep square, halfmove, result, fullmove, move
+RESULT_OFFSET = 35  # byte offset of the result field in a record
+NO_EP = 255
+RESULT_CODES = {"1-0": 1, "1/2-1/2": 0, "0-1": -1, "*": -128}
+RESULT_NAMES = {code: name for name, code in RESULT_CODES.items()}
+
+# square nibble: 0 = empty, otherwise 1 + index in bitboard.PIECES
+NIBBLES = {piece: i + 1 for i, piece in enumerate(PIECES)}
+NIBBLES["--"] = 0
+NIBBLE_PIECES = ["--"] + PIECES
+
+
+def pack_position(gs, move_code, result):
+    """One record for the position in `gs`, with the move about to be played (a 16-bit code,
+    see move_code()) and the game result as a RESULT_CODES value."""
+    board = bytearray(32)
+    i = 0
+    for row in gs.board:
+        for c in range(0, 8, 2):
+            board[i] = NIBBLES[row[c]] | NIBBLES[row[c + 1]] << 4
+            i += 1
+    flags = gs.white_to_move
+    for bit, allowed in enumerate(gs.castling_rights):
+        if allowed:
+            flags |= 2 << bit
+    ep = gs.enpassant_target
+    return RECORD.pack(bytes(board), flags, ep[0] * 8 + ep[1] if ep else NO_EP, min(gs.halfmove_clock, 255),
+                       result, min(gs.fullmove_number, 0xFFFF), move_code)
+
+
+def move_code(move, promotion=None):
+    return move.move_id | PROMOTION_CODES[promotion if move.is_promotion else None] << 12
+
+
+class PositionRecord:
+    __slots__ = ("board", "white_to_move", "castling", "ep_square", "halfmove", "fullmove", "move_code", "result")
+
+    def __init__(self, data, offset=0):
+        board, flags, ep, halfmove, result, fullmove, code = RECORD.unpack_from(data, offset)
+        self.board = board
+        self.white_to_move = bool(flags & 1)
+        self.castling = "".join(flag for bit, flag in enumerate("KQkq") if flags & 2 << bit) or "-"
+        self.ep_square = None if ep == NO_EP else ep
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        self.move_code = code
+        self.result = RESULT_NAMES.get(result, "*")
+
+    def squares(self):
+        """64 piece codes ("wp", "--", ...), square index = row * 8 + col."""
+        found = []
+        for byte in self.board:
+            found.append(NIBBLE_PIECES[byte & 15])
+            found.append(NIBBLE_PIECES[byte >> 4])
+        return found
+
+    def fen(self):
+        squares = self.squares()
+        ranks = []
+        for r in range(8):
+            rank, empty = "", 0
+            for piece in squares[r * 8:r * 8 + 8]:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1]
+            ranks.append(rank + (str(empty) if empty else ""))
+        ep = "-"
+        if self.ep_square is not None:
+            ep = Move.cols_to_files[self.ep_square % 8] + Move.rows_to_ranks[self.ep_square // 8]
+        return " ".join(["/".join(ranks), "w" if self.white_to_move else "b", self.castling, ep,
+                         str(self.halfmove), str(self.fullmove)])
+
+    def move_notation(self):
+        """The move played, in coordinate notation ("e2e4", "e7e8q")."""
+        start, end = self.move_code & 0x3F, self.move_code >> 6 & 0x3F
+        text = "".join(Move.cols_to_files[sq % 8] + Move.rows_to_ranks[sq // 8] for sq in (start, end))
+        return text + (PROMOTION_TYPES[self.move_code >> 12 & 7] or "")
+
+
+def game_records(fen, codes, result, gs=None):
+    """Records for a game given as a start FEN and Move.encode codes (engine_worker.encode_game)."""
+    gs = gs or BitboardGameState()
+    gs.load_fen(fen)
+    result = RESULT_CODES.get(result, RESULT_CODES["*"])
+    for code in codes:
+        move, promotion = Move.decode(code, gs.board)
+        if move.is_promotion:
+            # codes without a piece promote to a queen, so record the queen too
+            promotion = promotion or 'q'
+        yield pack_position(gs, move_code(move, promotion), result)
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+
+
+def san_game_records(fen, san_moves, result, gs=None, first_ply=0):
+    """Records for a game given as SAN moves; stops at the first unreadable move."""
+    gs = gs or BitboardGameState()
+    try:
+        gs.load_fen(fen)
+    except ValueError:
+        return
+    result = RESULT_CODES.get(result, RESULT_CODES["*"])
+    for ply, san in enumerate(san_moves):
+        try:
+            move, promotion = parse_san(gs, san)
+        except SanError:
+            return
+        if ply >= first_ply:
+            yield pack_position(gs, move_code(move, promotion), result)
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+
+
+def pgn_records(games, first_ply=0):
+    """Records for every position of an iterable of PgnGame objects."""
+    gs = BitboardGameState()
+    for game in games:
+        yield from san_game_records(game.headers.get("FEN", STARTING_FEN), game.san_moves(), game.result,
+                                    gs, first_ply)
+
+
+class DatasetWriter:
+    def __init__(self, path, buffer_records=8192):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(HEADER.pack(MAGIC, 0))
+        self.buffer = bytearray()
+        self.buffer_bytes = buffer_records * RECORD.size
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp_path)
+
+    def add(self, record):
+        self.buffer += record
+        self.count += 1
+        if len(self.buffer) >= self.buffer_bytes:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def close(self):
+        """Flush, write the record count and move the file into place."""
+        if self.file.closed:
+            return
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.count))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([("board", "u1", (32,)), ("flags", "u1"), ("ep", "u1"), ("halfmove", "u1"),
+                     ("result", "i1"), ("fullmove", "<u2"), ("move", "<u2")])
+
+
+class Dataset:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError("not a position dataset: " + path)
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or HEADER.size + count * RECORD.size > size:
+            self.close()
+            raise ValueError("not a position dataset: " + path)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return PositionRecord(self.mm, HEADER.size + index * RECORD.size)
+
+    def array(self):
+        """All records as a read-only numpy.memmap of record_dtype() (no copy)."""
+        import numpy as np
+        return np.memmap(self.path, dtype=record_dtype(), mode="r", offset=HEADER.size, shape=(self.count,))
+
+    def batches(self, batch_size, shuffle=True, seed=None, drop_last=False):
+        """Yield structured arrays of `batch_size` records, in a random order if `shuffle`.
+
+        Each batch's indices are sorted before gathering, so reads walk the file forwards.
+        """
+        import numpy as np
+        records = self.array()
+        order = np.random.default_rng(seed).permutation(self.count) if shuffle else np.arange(self.count)
+        stop = self.count - self.count % batch_size if drop_last else self.count
+        for start in range(0, stop, batch_size):
+            yield records[np.sort(order[start:start + batch_size])]
+
+
+def board_squares(batch):
+    """(N, 64) uint8 nibble codes (0 = empty, 1 + bitboard.PIECES index) from a record batch."""
+    import numpy as np
+    board = batch["board"]
+    squares = np.empty((len(batch), 64), dtype=np.uint8)
+    squares[:, 0::2] = board & 15
+    squares[:, 1::2] = board >> 4
+    return squares
+
+
+def to_planes(batch):
+    """(N, 12, 8, 8) uint8 one-hot piece planes in bitboard.PIECES order, row 0 = rank 8."""
+    import numpy as np
+    squares = board_squares(batch)
+    codes = np.arange(1, 13, dtype=np.uint8)
+    return (squares[:, None, :] == codes[None, :, None]).astype(np.uint8).reshape(len(batch), 12, 8, 8)
+
+
+def to_position_batch(batch):
+    """A vectorized.PositionBatch of the records' positions (needs numpy)."""
+    import numpy as np
+    from vectorized import PositionBatch
+    planes = to_planes(batch).reshape(len(batch), 12, 64)
+    packed = np.packbits(planes, axis=2, bitorder="little")
+    bitboards = np.ascontiguousarray(packed).view("<u8").reshape(len(batch), 12)
+    return PositionBatch(bitboards.T, (batch["flags"] & 1).astype(bool))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and inspect binary position datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write every position of a PGN file")
+    export.add_argument("pgn", help="PGN file, or - for stdin")
+    export.add_argument("out", help="output dataset file")
+    export.add_argument("--plies-from", type=int, default=0, help="skip the first N plies of each game")
+    play = commands.add_parser("selfplay", help="play engine games and write their positions")
+    play.add_argument("out", help="output dataset file")
+    play.add_argument("player_a", help="random, depth:N, time:SECONDS or nodes:N")
+    play.add_argument("player_b", help="random, depth:N, time:SECONDS or nodes:N")
+    play.add_argument("--games", type=int, default=10, help="number of games (default 10)")
+    play.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    play.add_argument("--max-plies", type=int, default=400, help="adjudicate a draw after this many plies")
+    play.add_argument("--seed", type=int, default=0, help="seed for random players")
+    info = commands.add_parser("info", help="summarise a dataset")
+    info.add_argument("dataset", help="dataset file")
+    info.add_argument("--sample", type=int, default=0, help="print N random records")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        source = sys.stdin if args.pgn == "-" else open(args.pgn, encoding="utf-8", errors="replace")
+        try:
+            with DatasetWriter(args.out) as writer:
+                writer.extend(pgn_records(read_games(source), args.plies_from))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"{writer.count} positions written to {args.out}")
+        return 0
+
+    if args.command == "selfplay":
+        from selfplay import run_match
+        try:
+            reports = run_match(args.player_a, args.player_b, args.games, processes=args.workers, seed=args.seed,
+                                max_plies=args.max_plies, record=True)
+            with DatasetWriter(args.out) as writer:
+                gs = BitboardGameState()
+                for report in reports:
+                    writer.extend(san_game_records(report["fen"], report["san"], report["result"], gs))
+        except ValueError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 2
+        print(f"{writer.count} positions from {args.games} games written to {args.out}")
+        return 0
+
+    try:
+        dataset = Dataset(args.dataset)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    with dataset:
+        size = os.path.getsize(args.dataset)
+        result_bytes = dataset.mm[HEADER.size + RESULT_OFFSET:HEADER.size + len(dataset) * RECORD.size:RECORD.size]
+        counts = ", ".join(f"{name} {result_bytes.count(code & 0xFF)}" for name, code in RESULT_CODES.items())
+        print(f"{len(dataset)} positions, {size} bytes ({RECORD.size} per position)")
+        print("results: " + counts)
+        rng = random.Random(0)
+        for _ in range(min(args.sample, len(dataset))):
+            record = dataset[rng.randrange(len(dataset))]
+            print(f"{record.fen():72} {record.move_notation():6} {record.result}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
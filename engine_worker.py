@@ -0,0 +1,145 @@
+"""
+Background engine worker for the pygame front end.
+- searches and legal-move computations run in separate processes (one or more)
+- positions are posted as an optional starting FEN plus the moves played, packed with Move.encode
+- results come back on a queue that the UI polls each frame without blocking
+- with an opening book, positions found in the book are answered from it without searching;
+  every worker maps the same book file; tablebases are shared the same way
+- cancel() bumps a shared generation counter: running searches stop within ~1024 nodes
+  and results from older generations are dropped by poll()
+"""
+
+import multiprocessing
+import queue
+
+from bitboard import BitboardGameState
+from chess_engine import Move
+from opening_book import OpeningBook
+from search import Searcher, TranspositionTable
+from tablebase import Tablebases
+
+
+def encode_game(gs):
+    """Moves played so far as Move.encode() ints, including the promotion choices."""
+    return [mv.encode(mv.promotion_piece[1] if mv.promotion_piece else None) for mv in gs.move_log]
+
+
+def replay_game(codes, fen=None, gs=None):
+    """Play encoded moves from `fen` (or the initial position) and return the GameState."""
+    if gs is None:
+        gs = BitboardGameState()
+    if fen:
+        gs.load_fen(fen)
+    for code in codes:
+        move, promotion = Move.decode(code, gs.board)
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + (promotion or 'q'))
+    return gs
+
+
+def _search_message(job_id, generation, result, final):
+    message = {"id": job_id, "generation": generation, "kind": "search", "final": final}
+    if result is None or result.move is None:
+        message["move"] = None
+        return message
+    message.update({
+        "move": result.move.encode(result.promotion),
+        "score": result.score,
+        "score_string": result.score_string(),
+        "depth": result.depth,
+        "pv": result.pv,
+        "nodes": result.nodes,
+        "nps": result.nps,
+        "elapsed": result.elapsed,
+    })
+    return message
+
+
+def _worker_loop(requests, results, generation, tt_size, book_path, tablebase_dir):
+    searcher = Searcher(TranspositionTable(tt_size), Tablebases(tablebase_dir) if tablebase_dir else None)
+    book = OpeningBook(book_path) if book_path else None
+    while True:
+        job = requests.get()
+        if job is None:
+            break
+        job_id, job_generation, kind, fen, codes, options = job
+        if job_generation != generation.value:
+            continue
+        gs = replay_game(codes, fen)
+        if kind == "moves":
+            moves = gs.get_valid_moves()
+            results.put({"id": job_id, "generation": job_generation, "kind": kind, "final": True,
+                         "moves": [mv.encode() for mv in moves], "check": gs.check,
+                         "checkmate": gs.checkmate, "stalemate": gs.stalemate})
+            continue
+        choice = book.choose(gs) if book else None
+        if choice:
+            move, promotion = choice
+            results.put({"id": job_id, "generation": job_generation, "kind": kind, "final": True,
+                         "move": move.encode(promotion), "book": True})
+            continue
+        result = searcher.search(
+            gs, depth=options.get("depth"), time_limit=options.get("time_limit"),
+            node_limit=options.get("node_limit"),
+            callback=lambda info: results.put(_search_message(job_id, job_generation, info, False)),
+            should_stop=lambda: generation.value != job_generation)
+        results.put(_search_message(job_id, job_generation, result, True))
+
+
+class EngineWorker:
+    def __init__(self, processes=1, tt_size=1 << 18, book_path=None, tablebase_dir=None):
+        # spawn keeps the children free of the parent's pygame/display state
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.generation = context.Value('q', 0)
+        self.job_id = 0
+        self.processes = [context.Process(target=_worker_loop,
+                                          args=(self.requests, self.results, self.generation, tt_size, book_path,
+                                                tablebase_dir),
+                                          daemon=True)
+                          for _ in range(processes)]
+        for process in self.processes:
+            process.start()
+
+    def post_search(self, gs, time_limit=None, depth=None, node_limit=None, fen=None):
+        """Queue a search of the current position of `gs`; returns the job id."""
+        return self._post("search", gs, fen, {"time_limit": time_limit, "depth": depth, "node_limit": node_limit})
+
+    def post_legal_moves(self, gs, fen=None):
+        """Queue a legal-move computation; the result holds Move.encode() ints and the game flags."""
+        return self._post("moves", gs, fen, {})
+
+    def _post(self, kind, gs, fen, options):
+        self.job_id += 1
+        self.requests.put((self.job_id, self.generation.value, kind, fen, encode_game(gs), options))
+        return self.job_id
+
+    def cancel(self):
+        """Abandon every queued and running job."""
+        with self.generation.get_lock():
+            self.generation.value += 1
+
+    def poll(self):
+        """Return the next message for a live job, or None if there is nothing yet. Never blocks.
+
+        Search jobs send one message per completed depth ("final": False) and a last one
+        with "final": True.
+        """
+        while True:
+            try:
+                message = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if message["generation"] == self.generation.value:
+                return message
+
+    def close(self):
+        self.cancel()
+        for _ in self.processes:
+            self.requests.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
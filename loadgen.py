@@ -0,0 +1,150 @@
+"""
+Load generator for server.py.
+- runs --sessions concurrent games spread over --connections TCP connections
+- each game asks for its legal moves, plays a random one and repeats, until the game ends or
+  --plies moves have been played; every --engine-every moves it asks the engine to play instead
+- reports requests and moves per second, and p50/p99/max latency per operation
+
+Usage: python loadgen.py [--port N] [--sessions N] [--connections N] [--plies N] [--engine-every N]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+
+
+class Client:
+    """One connection; requests are matched to responses by id, so many games can share it."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, op, **fields):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        fields.update(op=op, id=request_id)
+        self.writer.write(json.dumps(fields, separators=(",", ":")).encode() + b"\n")
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = 0
+        self.moves = 0
+        self.games = 0
+
+    async def timed(self, client, op, **fields):
+        start = time.perf_counter()
+        response = await client.request(op, **fields)
+        self.latencies.setdefault(op, []).append(time.perf_counter() - start)
+        if not response["ok"]:
+            self.errors += 1
+        return response
+
+
+async def play_session(client, stats, rng, max_plies, engine_every):
+    response = await stats.timed(client, "new")
+    game = response["game"]
+    for ply in range(max_plies):
+        if engine_every and ply % engine_every == engine_every - 1:
+            response = await stats.timed(client, "engine", game=game, depth=1, play=True)
+        else:
+            moves = (await stats.timed(client, "moves", game=game))["moves"]
+            response = await stats.timed(client, "move", game=game, move=rng.choice(moves))
+        if not response["ok"]:
+            break
+        stats.moves += 1
+        if response["status"] != "ongoing":
+            break
+    await stats.timed(client, "close", game=game)
+    stats.games += 1
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def format_report(stats, elapsed):
+    lines = [f"{stats.games} games, {stats.moves} moves in {elapsed:.2f}s: "
+             f"{stats.moves / elapsed:,.0f} moves/s, "
+             f"{sum(map(len, stats.latencies.values())) / elapsed:,.0f} requests/s, {stats.errors} errors",
+             "op          count     p50 ms     p99 ms     max ms"]
+    for op, values in sorted(stats.latencies.items()):
+        values.sort()
+        lines.append(f"{op:8} {len(values):>8} {percentile(values, 0.5) * 1000:>10.2f} "
+                     f"{percentile(values, 0.99) * 1000:>10.2f} {values[-1] * 1000:>10.2f}")
+    return "\n".join(lines)
+
+
+async def run(host, port, sessions, connections, max_plies, engine_every, seed):
+    clients = [await Client.connect(host, port) for _ in range(connections)]
+    stats = Stats()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(play_session(clients[i % connections], stats, random.Random(rng.random()),
+                                        max_plies, engine_every)
+                           for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    server_stats = await clients[0].request("stats")
+    for client in clients:
+        await client.close()
+    return stats, elapsed, server_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive server.py with many concurrent random games")
+    parser.add_argument("--host", default="127.0.0.1", help="server address (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="server port (default 8765)")
+    parser.add_argument("--sessions", type=int, default=2000, help="concurrent games (default 2000)")
+    parser.add_argument("--connections", type=int, default=50, help="TCP connections (default 50)")
+    parser.add_argument("--plies", type=int, default=40, help="moves per game (default 40)")
+    parser.add_argument("--engine-every", type=int, default=0,
+                        help="let the engine (depth 1) play every Nth move (default: never)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    args = parser.parse_args(argv)
+
+    try:
+        stats, elapsed, server_stats = asyncio.run(run(args.host, args.port, args.sessions, args.connections,
+                                                       args.plies, args.engine_every, args.seed))
+    except ConnectionError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    print(format_report(stats, elapsed))
+    print("server: " + " ".join(f"{key} {value}" for key, value in server_stats.items() if key not in ("id", "ok")))
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
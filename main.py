@@ -6,11 +6,19 @@ Pygame UI for the chess engine.
 - Pawn promotion choice popup (Q,R,B,N)
 - Highlights: selected square, valid moves, last move
 - Move log on the right and status in window caption (Check / Checkmate / Stalemate / Draw)
+- Optional engine opponent (HUMAN_PLAYS_WHITE / HUMAN_PLAYS_BLACK) searching in a background process
+- Tablebase verdict (e.g. "White mates in 7") in the caption for KQK/KRK/KPK endings
+- Dirty-region rendering: only changed squares and move-log rows are repainted, and the
+  loop sleeps on the event queue while nothing is happening
+- pygame is imported by main() rather than at module load, so engine worker processes (which
+  re-import this module under spawn) never load it; piece sprites come from one pre-scaled
+  atlas cached on disk (see sprites.py)
 """
 
-import pygame
 import sys
 from chess_engine import GameState, Move
+from engine_worker import EngineWorker
+from tablebase import Tablebases
 
 # UI constants
 HEIGHT = 512
@@ -19,14 +27,28 @@ SQ_SIZE = HEIGHT // DIMENSION
 MOVE_LOG_PANEL_WIDTH = 300
 WIDTH = HEIGHT + MOVE_LOG_PANEL_WIDTH
 MAX_FPS = 15
-IMAGES = {}
+SPRITES = None  # sprites.SpriteAtlas, loaded by main()
+pygame = None  # imported by main()
+HUMAN_PLAYS_WHITE = True
+HUMAN_PLAYS_BLACK = True
+ENGINE_TIME_LIMIT = 2.0  # seconds per engine move
+OPENING_BOOK = None  # path to a book file built with opening_book.py
+TABLEBASE_DIR = "tablebases"  # generated with: python tablebase.py generate
+
+def import_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
 
 def load_images():
-    pieces = ["wp", "wr", "wn", "wb", "wq", "wk", "bp", "br", "bn", "bb", "bq", "bk"]
-    for piece in pieces:
-        IMAGES[piece] = pygame.transform.scale(pygame.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+    global SPRITES
+    import sprites
+    SPRITES = sprites.load_atlas("images", SQ_SIZE)
 
-def main():
+def main(max_frames=None):
+    """Run the game window; `max_frames` stops after that many frames (for startup benchmarks)."""
+    import_pygame()
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     clock = pygame.time.Clock()
@@ -35,22 +57,41 @@ def main():
     valid_moves = gs.get_valid_moves()
     move_made = False
     load_images()
+    renderer = BoardRenderer(screen)
+    caption = "Chess"
     running = True
     sq_selected = ()  # (r, c)
     player_clicks = []
     last_move = None
+    worker = None if HUMAN_PLAYS_WHITE and HUMAN_PLAYS_BLACK else EngineWorker(book_path=OPENING_BOOK,
+                                                                                tablebase_dir=TABLEBASE_DIR)
+    tablebases = Tablebases(TABLEBASE_DIR)
+    tablebase_status = ""
+    engine_job = None
+    engine_status = ""
+    frames = 0
 
     while running:
-        for e in pygame.event.get():
-            if e.type == pygame.QUIT:
+        human_turn = HUMAN_PLAYS_WHITE if gs.white_to_move else HUMAN_PLAYS_BLACK
+        if move_made or renderer.full_redraw or engine_job is not None or (worker and not human_turn):
+            events = pygame.event.get()
+        else:
+            # nothing to animate or poll: sleep until the user does something
+            events = [pygame.event.wait()] + pygame.event.get()
+        for e in events:
+            if e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+                renderer.invalidate()
+            elif e.type == pygame.QUIT:
                 running = False
+                if worker:
+                    worker.close()
                 pygame.quit()
                 sys.exit()
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 location = pygame.mouse.get_pos()
                 col = location[0] // SQ_SIZE
                 row = location[1] // SQ_SIZE
-                if location[0] < HEIGHT:
+                if location[0] < HEIGHT and human_turn:
                     if sq_selected == (row, col):
                         sq_selected = ()
                         player_clicks = []
@@ -71,102 +112,224 @@ def main():
                             player_clicks = []
 
                             if gs.pawn_promotion:
-                                color, r_prom, c_prom = gs.pawn_promotion
-                                promoted_piece_code = choose_promotion(screen, color)
-                                gs.board[r_prom][c_prom] = promoted_piece_code
-                                gs.move_log[-1].piece_moved = promoted_piece_code # Update the move object
-                                gs.pawn_promotion = None
+                                color, _, _ = gs.pawn_promotion
+                                gs.promote_pawn(choose_promotion(screen, color))
+                                renderer.invalidate()
                         else:
                             player_clicks = [sq_selected]
                 else:
                     pass
-            elif e.type == pygame.KEYDOWN:
+            elif e.type == pygame.KEYDOWN and e.key in (pygame.K_z, pygame.K_r):
+                if worker:
+                    worker.cancel()
+                    engine_job = None
+                    engine_status = ""
                 if e.key == pygame.K_z:
                     gs.undo_move()
+                    # against the engine, take back its reply too so the human is to move again
+                    while (worker and (HUMAN_PLAYS_WHITE or HUMAN_PLAYS_BLACK) and gs.move_log
+                           and not (HUMAN_PLAYS_WHITE if gs.white_to_move else HUMAN_PLAYS_BLACK)):
+                        gs.undo_move()
                     move_made = True
+                    sq_selected = ()
+                    player_clicks = []
                     last_move = None
-                elif e.key == pygame.K_r:
+                else:
                     gs = GameState()
                     valid_moves = gs.get_valid_moves()
                     move_made = False
+                    tablebase_status = ""
                     sq_selected = ()
                     player_clicks = []
                     last_move = None
 
         if move_made:
-            valid_moves = gs.get_valid_moves()
+            if HUMAN_PLAYS_WHITE if gs.white_to_move else HUMAN_PLAYS_BLACK:
+                valid_moves = gs.get_valid_moves()
+            else:
+                # the engine generates its own moves; only the game-over check is needed here
+                gs.has_legal_move()
+                valid_moves = []
             move_made = False
+            tablebase_status = tablebase_verdict(tablebases, gs)
+
+        human_turn = HUMAN_PLAYS_WHITE if gs.white_to_move else HUMAN_PLAYS_BLACK
+        if worker and not human_turn and not (gs.checkmate or gs.stalemate):
+            if engine_job is None:
+                engine_job = worker.post_search(gs, time_limit=ENGINE_TIME_LIMIT)
+                engine_status = "Engine thinking..."
+            message = worker.poll()
+            if message and message["id"] == engine_job:
+                if not message["final"]:
+                    engine_status = "Engine thinking... depth %d, %s" % (message["depth"], message["score_string"])
+                else:
+                    engine_job = None
+                    engine_status = ""
+                    if message["move"] is not None:
+                        move, promotion = Move.decode(message["move"], gs.board)
+                        gs.make_move(move)
+                        if gs.pawn_promotion:
+                            gs.promote_pawn(gs.pawn_promotion[0] + (promotion or 'q'))
+                        last_move = move
+                        move_made = True
 
-        draw_game_state(screen, gs, valid_moves, sq_selected, last_move)
+        renderer.draw(gs, valid_moves, sq_selected, last_move)
         if gs.checkmate:
-            pygame.display.set_caption("Checkmate! Game Over")
+            new_caption = "Checkmate! Game Over"
         elif gs.stalemate:
-            pygame.display.set_caption("Stalemate! Draw")
+            new_caption = "Stalemate! Draw"
         elif gs.check:
-            pygame.display.set_caption("Check!")
-        elif gs.insufficient_material() or gs.halfmove_clock >= 100:
-            pygame.display.set_caption("Draw (Insufficient material / 50-move)")
+            new_caption = "Check!"
+        elif gs.insufficient_material() or gs.halfmove_clock >= 100 or gs.is_threefold_repetition():
+            new_caption = "Draw (Insufficient material / 50-move / repetition)"
+        elif engine_status:
+            new_caption = engine_status
         else:
-            pygame.display.set_caption("Chess")
+            new_caption = "Chess"
+        if tablebase_status and not (gs.checkmate or gs.stalemate):
+            new_caption += " - " + tablebase_status
+        if new_caption != caption:
+            caption = new_caption
+            pygame.display.set_caption(caption)
 
+        frames += 1
+        if max_frames and frames >= max_frames:
+            if worker:
+                worker.close()
+            pygame.quit()
+            return
         clock.tick(MAX_FPS)
-        pygame.display.flip()
-
-def draw_game_state(screen, gs, valid_moves, sq_selected, last_move):
-    draw_board(screen)
-    highlight_squares(screen, gs, valid_moves, sq_selected, last_move)
-    draw_pieces(screen, gs.board)
-    draw_move_log(screen, gs)
-
-def draw_board(screen):
-    colors = [pygame.Color("burlywood1"), pygame.Color("saddlebrown")]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[(r + c) % 2]
-            pygame.draw.rect(screen, color, pygame.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-def highlight_squares(screen, gs, valid_moves, sq_selected, last_move):
-    s = pygame.Surface((SQ_SIZE, SQ_SIZE))
-    s.set_alpha(120)
-    if last_move:
-        s.fill(pygame.Color("yellow"))
-        screen.blit(s, (last_move.start_col * SQ_SIZE, last_move.start_row * SQ_SIZE))
-        screen.blit(s, (last_move.end_col * SQ_SIZE, last_move.end_row * SQ_SIZE))
-    if sq_selected != ():
-        r, c = sq_selected
-        if gs.board[r][c] != "--" and ((gs.board[r][c][0] == 'w') == gs.white_to_move):
-            s.fill(pygame.Color("blue"))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-            s.fill(pygame.Color("green"))
-            for mv in valid_moves:
-                if mv.start_row == r and mv.start_col == c:
-                    screen.blit(s, (mv.end_col * SQ_SIZE, mv.end_row * SQ_SIZE))
-
-def draw_pieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], pygame.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-def draw_move_log(screen, gs):
-    font = pygame.font.SysFont("Arial", 16)
-    move_log_surface = pygame.Surface((MOVE_LOG_PANEL_WIDTH, HEIGHT))
-    move_log_surface.fill(pygame.Color("lightgray"))
-    move_texts = []
-    for i in range(0, len(gs.move_log), 2):
-        move_string = str(i//2 + 1) + ". "
-        move_string += gs.move_log[i].get_chess_notation() + " "
-        if i + 1 < len(gs.move_log):
-            move_string += gs.move_log[i + 1].get_chess_notation()
-        move_texts.append(move_string)
-    padding = 5
-    text_y = padding
-    for line in move_texts:
-        text_object = font.render(line, True, pygame.Color("black"))
-        move_log_surface.blit(text_object, (padding, text_y))
-        text_y += 20
-    screen.blit(move_log_surface, (HEIGHT, 0))
+
+def tablebase_verdict(tablebases, gs):
+    found = tablebases.probe(gs)
+    if not found or not found[0]:
+        return "Tablebase draw" if found else ""
+    wdl, plies = found
+    winner = "White" if gs.white_to_move == (wdl > 0) else "Black"
+    return "%s mates in %d" % (winner, (plies + 1) // 2)
+
+class BoardRenderer:
+    """Keeps what is on screen in sync with the game while repainting as little as possible.
+
+    The empty board, the highlight overlays and each move-log line are rendered once and
+    cached. Every frame the (piece, overlays) of each square and the text of each log row
+    are compared with what was drawn last time; only the rects that differ are redrawn and
+    passed to pygame.display.update.
+    """
+    LOG_PADDING = 5
+    LOG_LINE_HEIGHT = 20
+    MAX_CACHED_LINES = 512
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.font = pygame.font.SysFont("Arial", 16)
+        self.board_surface = pygame.Surface((HEIGHT, HEIGHT))
+        colors = [pygame.Color("burlywood1"), pygame.Color("saddlebrown")]
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                pygame.draw.rect(self.board_surface, colors[(r + c) % 2],
+                                 pygame.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+        self.overlays = {}
+        for name in ("yellow", "blue", "green"):
+            overlay = pygame.Surface((SQ_SIZE, SQ_SIZE))
+            overlay.set_alpha(120)
+            overlay.fill(pygame.Color(name))
+            self.overlays[name] = overlay
+        self.log_background = pygame.Color("lightgray")
+        self.line_surfaces = {}
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget what is on screen so the next draw repaints everything."""
+        self.square_keys = [None] * (DIMENSION * DIMENSION)
+        self.logged_moves = []
+        self.log_lines = []
+        self.full_redraw = True
+
+    def draw(self, gs, valid_moves, sq_selected, last_move):
+        dirty = []
+        if self.full_redraw:
+            self.screen.fill(self.log_background, pygame.Rect(HEIGHT, 0, MOVE_LOG_PANEL_WIDTH, HEIGHT))
+            dirty.append(self.screen.get_rect())
+            self.full_redraw = False
+
+        overlays = self.square_overlays(gs, valid_moves, sq_selected, last_move)
+        for r in range(DIMENSION):
+            row = gs.board[r]
+            for c in range(DIMENSION):
+                key = (row[c], overlays.get((r, c), ()))
+                if key != self.square_keys[r * DIMENSION + c]:
+                    self.square_keys[r * DIMENSION + c] = key
+                    rect = pygame.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                    self.screen.blit(self.board_surface, rect, rect)
+                    for name in key[1]:
+                        self.screen.blit(self.overlays[name], rect)
+                    if key[0] != "--":
+                        SPRITES.blit(self.screen, key[0], rect)
+                    dirty.append(rect)
+
+        dirty.extend(self.draw_move_log(gs))
+        if dirty:
+            pygame.display.update(dirty)
+
+    def square_overlays(self, gs, valid_moves, sq_selected, last_move):
+        """{(r, c): overlay colors in blit order} for the current highlights."""
+        overlays = {}
+        if last_move:
+            overlays[(last_move.start_row, last_move.start_col)] = ("yellow",)
+            overlays[(last_move.end_row, last_move.end_col)] = ("yellow",)
+        if sq_selected != ():
+            r, c = sq_selected
+            piece = gs.board[r][c]
+            if piece != "--" and (piece[0] == 'w') == gs.white_to_move:
+                overlays[(r, c)] = overlays.get((r, c), ()) + ("blue",)
+                for mv in valid_moves:
+                    if mv.start_row == r and mv.start_col == c:
+                        end = (mv.end_row, mv.end_col)
+                        overlays[end] = overlays.get(end, ()) + ("green",)
+        return overlays
+
+    def draw_move_log(self, gs):
+        moves = gs.move_log
+        logged = self.logged_moves
+        # only the rows from the first move that differs from the last frame need new text
+        same = min(len(logged), len(moves))
+        while same and logged[same - 1] is not moves[same - 1]:
+            same -= 1
+        if same == len(logged) == len(moves):
+            return []
+        first_row = same // 2
+        lines = self.log_lines[:first_row]
+        for i in range(first_row * 2, len(moves), 2):
+            line = str(i // 2 + 1) + ". " + moves[i].get_chess_notation() + " "
+            if i + 1 < len(moves):
+                line += moves[i + 1].get_chess_notation()
+            lines.append(line)
+
+        dirty = []
+        for row in range(first_row, max(len(lines), len(self.log_lines))):
+            line = lines[row] if row < len(lines) else None
+            old = self.log_lines[row] if row < len(self.log_lines) else None
+            y = self.LOG_PADDING + row * self.LOG_LINE_HEIGHT
+            if line == old or y >= HEIGHT:
+                continue
+            rect = pygame.Rect(HEIGHT, y, MOVE_LOG_PANEL_WIDTH, self.LOG_LINE_HEIGHT)
+            self.screen.fill(self.log_background, rect)
+            if line is not None:
+                self.screen.blit(self.render_line(line), (HEIGHT + self.LOG_PADDING, y))
+            dirty.append(rect)
+        self.logged_moves = list(moves)
+        self.log_lines = lines
+        return dirty
+
+    def render_line(self, line):
+        surface = self.line_surfaces.get(line)
+        if surface is None:
+            if len(self.line_surfaces) >= self.MAX_CACHED_LINES:
+                self.line_surfaces.clear()
+            surface = self.font.render(line, True, pygame.Color("black"))
+            self.line_surfaces[line] = surface
+        return surface
 
 def choose_promotion(screen, color):
     pieces = [color + p for p in ['q', 'r', 'b', 'n']]
@@ -180,7 +343,7 @@ def choose_promotion(screen, color):
     for i, p in enumerate(pieces):
         rect = pygame.Rect(start_x + i * (SQ_SIZE + 10), start_y, SQ_SIZE, SQ_SIZE)
         pygame.draw.rect(screen, pygame.Color("white"), rect)
-        screen.blit(IMAGES[p], rect)
+        SPRITES.blit(screen, p, rect)
         option_rects.append((rect, p))
     pygame.display.flip()
     selecting = True
@@ -0,0 +1,225 @@
+"""
+Binary opening book built from PGN games.
+- file layout: 16-byte header, then 16-byte big-endian entries (Zobrist key, Move.encode code,
+  weight) sorted by key
+- opened with mmap: opening is instant whatever the file size, and every process that opens the
+  book shares one page-cached copy
+- lookups binary-search the mapped file, so only a few pages are touched per probe
+- weights are 2 per win, 1 per draw for the side that played the move; building spills sorted
+  runs to temporary files and merges them, so memory stays bounded on large collections
+
+Usage: python opening_book.py build games.pgn book.bin [--plies N] [--min-weight N]
+       python opening_book.py probe book.bin [--fen FEN]
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+
+from bitboard import BitboardGameState
+from chess_engine import PROMOTION_TYPES, STARTING_FEN
+from pgn import SanError, move_to_san, parse_san, read_games
+from search import move_notation
+
+MAGIC = b"CHESSBK1"
+HEADER = struct.Struct(">8sQ")  # magic, entry count
+ENTRY = struct.Struct(">QII")  # zobrist key, move code, weight
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFFFFFF
+
+
+def _game_entries(game, gs, max_plies):
+    """(key, move code, weight) for the first `max_plies` moves of a PgnGame."""
+    try:
+        gs.load_fen(game.headers.get("FEN", STARTING_FEN))
+    except ValueError:
+        return
+    result = game.result
+    for san in game.san_moves()[:max_plies]:
+        try:
+            move, promotion = parse_san(gs, san)
+        except SanError:
+            return
+        if result == "1/2-1/2":
+            weight = 1
+        elif result in ("1-0", "0-1"):
+            weight = 2 if (result == "1-0") == gs.white_to_move else 0
+        else:
+            weight = 1
+        if weight:
+            yield gs.zobrist_key, move.encode(promotion), weight
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+
+
+def _write_run(counts):
+    run = tempfile.TemporaryFile()
+    for (key, code), weight in sorted(counts.items()):
+        run.write(ENTRY.pack(key, code, min(weight, MAX_WEIGHT)))
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    while True:
+        data = run.read(ENTRY.size * 4096)
+        if not data:
+            return
+        yield from ENTRY.iter_unpack(data)
+
+
+def build_book(games, path, max_plies=30, min_weight=1, run_entries=1 << 20):
+    """Write a book file from an iterable of PgnGame objects; returns the number of entries."""
+    gs = BitboardGameState()
+    counts = {}
+    runs = []
+    for game in games:
+        for key, code, weight in _game_entries(game, gs, max_plies):
+            counts[key, code] = counts.get((key, code), 0) + weight
+        if len(counts) >= run_entries:
+            runs.append(_write_run(counts))
+            counts = {}
+    runs.append(_write_run(counts))
+
+    written = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, 0))
+        current, total = None, 0
+        for key, code, weight in heapq.merge(*(_read_run(run) for run in runs)):
+            if (key, code) != current:
+                if current is not None and total >= min_weight:
+                    out.write(ENTRY.pack(current[0], current[1], min(total, MAX_WEIGHT)))
+                    written += 1
+                current, total = (key, code), 0
+            total += weight
+        if current is not None and total >= min_weight:
+            out.write(ENTRY.pack(current[0], current[1], min(total, MAX_WEIGHT)))
+            written += 1
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, written))
+    for run in runs:
+        run.close()
+    os.replace(tmp_path, path)
+    return written
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError("not an opening book: " + path)
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or HEADER.size + count * ENTRY.size > size:
+            self.close()
+            raise ValueError("not an opening book: " + path)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def entries(self, key):
+        """[(move code, weight)] stored for a Zobrist key."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.mm, HEADER.size + mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        offset = HEADER.size + lo * ENTRY.size
+        while lo < self.count:
+            entry_key, code, weight = ENTRY.unpack_from(self.mm, offset)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            lo += 1
+            offset += ENTRY.size
+        return found
+
+    def moves(self, gs, legal_moves=None):
+        """[(move, promotion type or None, weight)] for the current position, checked for legality."""
+        entries = self.entries(gs.zobrist_key)
+        if not entries:
+            return []
+        if legal_moves is None:
+            legal_moves = gs.get_valid_moves()
+        by_id = {mv.move_id: mv for mv in legal_moves}
+        found = []
+        for code, weight in entries:
+            move = by_id.get(code & 0xFFF)
+            if move is not None:
+                promotion = (PROMOTION_TYPES[code >> 15 & 7] or 'q') if move.is_promotion else None
+                found.append((move, promotion, weight))
+        return found
+
+    def choose(self, gs, legal_moves=None, rng=random):
+        """Pick a book move with probability proportional to its weight.
+
+        Returns (move, promotion type or None), or None when the position is not in the book.
+        """
+        found = self.moves(gs, legal_moves)
+        if not found:
+            return None
+        move, promotion, _ = rng.choices(found, weights=[weight for _, _, weight in found])[0]
+        return move, promotion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a binary opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from a PGN file")
+    build.add_argument("pgn", help="PGN file, or - for stdin")
+    build.add_argument("book", help="output book file")
+    build.add_argument("--plies", type=int, default=30, help="moves per game to include (default 30)")
+    build.add_argument("--min-weight", type=int, default=1, help="drop entries below this weight")
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book", help="book file")
+    probe.add_argument("--fen", default=STARTING_FEN, help="position (default: initial position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        source = sys.stdin if args.pgn == "-" else open(args.pgn, encoding="utf-8", errors="replace")
+        try:
+            written = build_book(read_games(source), args.book, args.plies, args.min_weight)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"{written} entries written to {args.book}")
+        return 0
+
+    gs = BitboardGameState.from_fen(args.fen)
+    with OpeningBook(args.book) as book:
+        found = book.moves(gs)
+        total = sum(weight for _, _, weight in found)
+        legal_moves = gs.get_valid_moves()
+        for move, promotion, weight in sorted(found, key=lambda entry: -entry[2]):
+            print(f"{move_to_san(gs, move, promotion, legal_moves):8} {move_notation(move, promotion):6} "
+                  f"weight {weight:>8} ({100 * weight / total:.1f}%)")
+    if not found:
+        print("position not in book")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
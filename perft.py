@@ -0,0 +1,121 @@
+"""
+Perft benchmark and correctness suite for the chess engine.
+- catalogue of standard positions with known node counts
+- prints nodes, elapsed time and nodes/second per depth
+- --json writes one JSON object per line for tracking results over time
+- --divide prints per-root-move counts to narrow down a mismatch
+- --profile prints move-generator counters and timings (see profiling.py) at the end
+- exit status is 1 if any count differs from the catalogue
+
+Usage: python perft.py [--depth N] [--position NAME ...] [--backend grid|bitboard] [--json] [--profile]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from chess_engine import GameState
+from bitboard import BitboardGameState
+import profiling
+
+# name -> (fen, {depth: nodes})
+POSITIONS = {
+    "initial": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    "endgame": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624, 6: 11030083}),
+    "promotions": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                   {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    "middlegame": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                   {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    "illegal_ep_pin": ("3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+                       {1: 18, 2: 92, 3: 1670, 4: 10138}),
+    "ep_check": ("8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+                 {1: 15, 2: 126, 3: 1928, 4: 13931}),
+    "ep_discovered_check": ("8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+                            {1: 13, 2: 102, 3: 1266, 4: 10276}),
+    "short_castle_check": ("5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+                           {1: 15, 2: 66, 3: 1198, 4: 6399}),
+    "long_castle_check": ("3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+                          {1: 16, 2: 71, 3: 1286, 4: 7418}),
+    "castle_rights": ("r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+                      {1: 26, 2: 1141, 3: 27826}),
+    "castling_prevented": ("r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+                           {1: 44, 2: 1494, 3: 50509}),
+    "promote_out_of_check": ("2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+                             {1: 11, 2: 133, 3: 1442, 4: 19174}),
+    "underpromote_check": ("8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+                           {1: 29, 2: 165, 3: 5160, 4: 31961}),
+    "self_stalemate": ("K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+                       {1: 2, 2: 6, 3: 13, 4: 63, 5: 382}),
+    "stalemate_checkmate": ("8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+                            {1: 10, 2: 25, 3: 268, 4: 926, 5: 10857}),
+}
+
+BACKENDS = {"grid": GameState, "bitboard": BitboardGameState}
+
+
+def run_perft(fen, depth, backend=GameState):
+    """Return (nodes, elapsed seconds) for perft(depth) from `fen`."""
+    gs = backend.from_fen(fen)
+    start = time.perf_counter()
+    nodes = gs.perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft benchmark and move generator check")
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth to run (default 3)")
+    parser.add_argument("--position", nargs="*", choices=sorted(POSITIONS), help="positions to run (default all)")
+    parser.add_argument("--fen", help="run an arbitrary position instead of the catalogue")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print per-move counts at the maximum depth")
+    parser.add_argument("--json", action="store_true", help="emit JSON lines instead of a table")
+    parser.add_argument("--profile", action="store_true", help="print instrumentation counters and timings")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
+
+    backend = BACKENDS[args.backend]
+    if args.fen:
+        positions = {"fen": (args.fen, {})}
+    else:
+        positions = {name: POSITIONS[name] for name in (args.position or POSITIONS)}
+
+    failures = 0
+    for name, (fen, expected) in positions.items():
+        if args.divide:
+            gs = backend.from_fen(fen)
+            counts = gs.divide(args.depth)
+            if args.json:
+                print(json.dumps({"position": name, "depth": args.depth, "divide": counts}))
+            else:
+                for notation in sorted(counts):
+                    print(f"{notation}: {counts[notation]}")
+                print(f"{name}: {sum(counts.values())} nodes")
+            continue
+        for depth in range(1, args.depth + 1):
+            if expected and depth not in expected:
+                break
+            nodes, elapsed = run_perft(fen, depth, backend)
+            nps = nodes / elapsed if elapsed > 0 else 0.0
+            ok = expected.get(depth, nodes) == nodes
+            failures += not ok
+            if args.json:
+                print(json.dumps({"position": name, "backend": args.backend, "depth": depth,
+                                  "nodes": nodes, "expected": expected.get(depth),
+                                  "seconds": round(elapsed, 6), "nps": round(nps), "ok": ok}))
+            else:
+                status = "ok" if ok else f"FAIL (expected {expected[depth]})"
+                print(f"{name:22} depth {depth}: {nodes:>10} nodes {elapsed:9.3f}s {nps:>10.0f} nps  {status}")
+            sys.stdout.flush()
+    if args.profile:
+        print(profiling.format_report(), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+PGN reading and SAN move notation.
+- read_games() yields games lazily from any iterable of lines, so files of any size stream
+- tokenize_movetext() strips comments, variations, NAGs, move numbers and results
+- move_to_san() / parse_san() convert between Move objects and SAN using get_valid_moves
+"""
+
+import re
+
+from chess_engine import Move
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_MOVE_NUMBER = re.compile(r"^\d+\.+")
+_COMMENT = re.compile(r"\{[^}]*\}")
+_LINE_COMMENT = re.compile(r";[^\n]*")
+_VARIATION = re.compile(r"\([^()]*\)")
+_PIECE_LETTERS = {'N': 'n', 'B': 'b', 'R': 'r', 'Q': 'q', 'K': 'k'}
+
+
+class SanError(ValueError):
+    pass
+
+
+class PgnGame:
+    __slots__ = ("headers", "movetext")
+
+    def __init__(self, headers, movetext):
+        self.headers = headers
+        self.movetext = movetext
+
+    @property
+    def result(self):
+        return self.headers.get("Result", "*")
+
+    def san_moves(self):
+        return tokenize_movetext(self.movetext)
+
+
+def read_games(lines):
+    """Yield a PgnGame for each game in an iterable of PGN lines (e.g. an open file)."""
+    headers = {}
+    movetext = []
+    comment_depth = 0
+    for line in lines:
+        stripped = line.strip()
+        if comment_depth == 0:
+            if not stripped or stripped.startswith("%"):
+                continue
+            if stripped.startswith("["):
+                if movetext:
+                    yield PgnGame(headers, "\n".join(movetext))
+                    headers, movetext = {}, []
+                match = _TAG.match(stripped)
+                if match:
+                    headers[match.group(1)] = match.group(2).replace('\\"', '"')
+                continue
+        movetext.append(stripped)
+        # brace comments may span lines and contain "[" at the start of a line
+        comment_depth = max(0, comment_depth + stripped.count("{") - stripped.count("}"))
+    if headers or movetext:
+        yield PgnGame(headers, "\n".join(movetext))
+
+
+def tokenize_movetext(movetext):
+    """Return the SAN tokens of the main line of a PGN movetext."""
+    text = _COMMENT.sub(" ", movetext)
+    text = _LINE_COMMENT.sub(" ", text)
+    previous = None
+    while previous != text:
+        previous = text
+        text = _VARIATION.sub(" ", text)
+    tokens = []
+    for token in text.split():
+        token = _MOVE_NUMBER.sub("", token)
+        if not token or token in RESULTS or token.startswith("$"):
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def move_to_san(gs, move, promotion=None, legal_moves=None):
+    """SAN for a legal `move` in the current position (promotion is 'q', 'r', 'b' or 'n')."""
+    if legal_moves is None:
+        legal_moves = gs.get_valid_moves()
+    if move.is_castle_move:
+        san = "O-O" if move.end_col > move.start_col else "O-O-O"
+    else:
+        ptype = move.piece_moved[1]
+        destination = move.get_rank_file(move.end_row, move.end_col)
+        capture = move.piece_captured != "--"
+        if ptype == 'p':
+            san = (Move.cols_to_files[move.start_col] + "x" if capture else "") + destination
+            if move.is_promotion:
+                san += "=" + (promotion or 'q').upper()
+        else:
+            rivals = [mv for mv in legal_moves
+                      if mv.piece_moved == move.piece_moved and mv.end_row == move.end_row
+                      and mv.end_col == move.end_col and mv.move_id != move.move_id]
+            disambiguation = ""
+            if rivals:
+                if all(mv.start_col != move.start_col for mv in rivals):
+                    disambiguation = Move.cols_to_files[move.start_col]
+                elif all(mv.start_row != move.start_row for mv in rivals):
+                    disambiguation = Move.rows_to_ranks[move.start_row]
+                else:
+                    disambiguation = move.get_rank_file(move.start_row, move.start_col)
+            san = ptype.upper() + disambiguation + ("x" if capture else "") + destination
+
+    gs.make_move(move)
+    if gs.pawn_promotion:
+        gs.promote_pawn(gs.pawn_promotion[0] + (promotion or 'q'))
+    replies = gs.get_valid_moves()
+    if gs.check:
+        san += "+" if replies else "#"
+    gs.undo_move()
+    gs.get_valid_moves()
+    return san
+
+
+def parse_san(gs, san, legal_moves=None):
+    """Return (move, promotion type or None) for a SAN string in the current position.
+
+    Raises SanError if the move is malformed, illegal or ambiguous.
+    """
+    if legal_moves is None:
+        legal_moves = gs.get_valid_moves()
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        end_col = 6 if len(text) == 3 else 2
+        for mv in legal_moves:
+            if mv.is_castle_move and mv.end_col == end_col:
+                return mv, None
+        raise SanError("illegal move: " + san)
+
+    promotion = None
+    if "=" in text:
+        text, piece = text.split("=", 1)
+        promotion = piece[:1].lower()
+    elif len(text) > 2 and text[-1] in "QRBNqrbn" and text[-2] in "18":
+        promotion = text[-1].lower()
+        text = text[:-1]
+    if promotion is not None and promotion not in "qrbn":
+        raise SanError("bad promotion piece: " + san)
+
+    if text[:1] in _PIECE_LETTERS:
+        ptype = _PIECE_LETTERS[text[0]]
+        text = text[1:]
+    else:
+        ptype = 'p'
+    text = text.replace("x", "").replace("-", "")
+    if len(text) < 2 or text[-2] not in Move.files_to_cols or text[-1] not in Move.ranks_to_rows:
+        raise SanError("malformed move: " + san)
+    end_row, end_col = Move.ranks_to_rows[text[-1]], Move.files_to_cols[text[-2]]
+    from_file = from_rank = None
+    for ch in text[:-2]:
+        if ch in Move.files_to_cols:
+            from_file = Move.files_to_cols[ch]
+        elif ch in Move.ranks_to_rows:
+            from_rank = Move.ranks_to_rows[ch]
+        else:
+            raise SanError("malformed move: " + san)
+
+    candidates = [mv for mv in legal_moves
+                  if mv.piece_moved[1] == ptype and mv.end_row == end_row and mv.end_col == end_col
+                  and not mv.is_castle_move
+                  and (from_file is None or mv.start_col == from_file)
+                  and (from_rank is None or mv.start_row == from_rank)]
+    if not candidates:
+        raise SanError("illegal move: " + san)
+    if len(candidates) > 1:
+        raise SanError("ambiguous move: " + san)
+    move = candidates[0]
+    if move.is_promotion:
+        return move, promotion or 'q'
+    if promotion:
+        raise SanError("illegal promotion: " + san)
+    return move, None
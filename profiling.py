@@ -0,0 +1,245 @@
+"""
+Optional instrumentation for the engine's hot paths.
+- enable() wraps methods of Move, GameState and its subclasses; disable() restores the originals,
+  so a disabled engine runs exactly the uninstrumented code
+- counters: nodes (make_move calls), Move objects created, pseudo-legal and legal moves,
+  legality rejections, attack queries (nested queries, e.g. square_under_attack calling
+  attackers_exist, count once) and legal-move cache hits/misses from every cache lookup
+- timers (calls, total and worst seconds) for get_valid_moves, generate_valid_moves,
+  has_legal_move, make_move and undo_move
+- the slowest move generations are kept with their FEN, to find pathological positions
+- snapshot() / reset() / format_report(), and start_reporting() to append a snapshot as a
+  JSON line every few seconds
+
+Not thread-safe: counters are plain ints updated from whichever thread runs the engine.
+"""
+
+import heapq
+import json
+import threading
+import time
+
+from chess_engine import GameState, Move
+
+TIMED = ("get_valid_moves", "generate_valid_moves", "has_legal_move", "make_move", "undo_move")
+ATTACK_QUERIES = ("square_under_attack", "attackers_exist", "get_attacked_squares",
+                  "_king_danger")
+LEGALITY_FILTER = "_legal_among"  # every generation path passes its pseudo-legal moves through this
+SLOWEST_KEPT = 10
+
+_originals = []  # (class, name, original attribute)
+_cache_properties = []  # GameState counter attributes replaced while enabled
+_depth = {}
+_counters = {}
+_timers = {}
+_slowest = []
+_reporter = None
+
+
+def reset():
+    """Zero every counter and timer."""
+    _counters.clear()
+    _counters.update({name: 0 for name in (
+        "nodes", "moves_created", "pseudo_legal_moves", "legal_moves", "legality_rejections",
+        "attack_queries", "move_cache_hits", "move_cache_misses")})
+    _timers.clear()
+    _timers.update({name: [0, 0.0, 0.0] for name in TIMED})
+    del _slowest[:]
+
+
+reset()
+
+
+def enabled():
+    return bool(_originals)
+
+
+def _classes():
+    pending, found = [GameState], []
+    while pending:
+        cls = pending.pop()
+        found.append(cls)
+        pending.extend(cls.__subclasses__())
+    return found
+
+
+def _patch(cls, name, wrapper):
+    original = cls.__dict__[name]
+    _originals.append((cls, name, original))
+    setattr(cls, name, wrapper(original))
+
+
+def _outermost(key, original, before, after):
+    # overrides call super() and queries call each other, so only the outermost call per key counts
+    def wrapped(self, *args, **kwargs):
+        if _depth.get(key):
+            return original(self, *args, **kwargs)
+        _depth[key] = 1
+        state = before(self)
+        try:
+            result = original(self, *args, **kwargs)
+        finally:
+            _depth[key] = 0
+        after(self, state, result)
+        return result
+    wrapped.__name__ = original.__name__
+    wrapped.__doc__ = original.__doc__
+    return wrapped
+
+
+def _timed(name):
+    def before(gs):
+        return time.perf_counter()
+
+    def after(gs, state, result):
+        elapsed = time.perf_counter() - state
+        timer = _timers[name]
+        timer[0] += 1
+        timer[1] += elapsed
+        if elapsed > timer[2]:
+            timer[2] = elapsed
+        if name == "make_move":
+            _counters["nodes"] += 1
+        elif name == "generate_valid_moves":
+            if len(_slowest) < SLOWEST_KEPT or elapsed > _slowest[0][0]:
+                entry = (elapsed, gs.to_fen())
+                if len(_slowest) < SLOWEST_KEPT:
+                    heapq.heappush(_slowest, entry)
+                else:
+                    heapq.heapreplace(_slowest, entry)
+
+    return lambda original: _outermost(name, original, before, after)
+
+
+def _counted(counter):
+    def after(gs, state, result):
+        _counters[counter] += 1
+    return lambda original: _outermost(counter, original, lambda gs: None, after)
+
+
+def _cache_counter(attribute):
+    # every increment of gs.move_cache_hits/misses, whichever method makes it, is added here too
+    def get(gs):
+        return gs.__dict__.get(attribute, 0)
+
+    def set_(gs, value):
+        old = gs.__dict__.get(attribute)
+        if old is not None and value > old:
+            _counters[attribute] += value - old
+        gs.__dict__[attribute] = value
+    return property(get, set_)
+
+
+def _count_legality(original):
+    def wrapped(self, moves, *args):
+        legal_moves = original(self, moves, *args)
+        _counters["pseudo_legal_moves"] += len(moves)
+        _counters["legal_moves"] += len(legal_moves)
+        _counters["legality_rejections"] += len(moves) - len(legal_moves)
+        return legal_moves
+    return wrapped
+
+
+def _count_moves_created(original):
+    def wrapped(self, *args, **kwargs):
+        _counters["moves_created"] += 1
+        original(self, *args, **kwargs)
+    return wrapped
+
+
+def enable():
+    """Start instrumenting; classes must already be imported (e.g. import bitboard first)."""
+    if _originals:
+        return
+    _patch(Move, "__init__", _count_moves_created)
+    for cls in _classes():
+        for name in TIMED:
+            if name in cls.__dict__:
+                _patch(cls, name, _timed(name))
+        for name in ATTACK_QUERIES:
+            if name in cls.__dict__:
+                _patch(cls, name, _counted("attack_queries"))
+        if LEGALITY_FILTER in cls.__dict__:
+            _patch(cls, LEGALITY_FILTER, _count_legality)
+    for attribute in ("move_cache_hits", "move_cache_misses"):
+        setattr(GameState, attribute, _cache_counter(attribute))
+        _cache_properties.append(attribute)
+
+
+def disable():
+    """Put back the original methods."""
+    while _originals:
+        cls, name, original = _originals.pop()
+        setattr(cls, name, original)
+    while _cache_properties:
+        delattr(GameState, _cache_properties.pop())
+    _depth.clear()
+
+
+def snapshot():
+    """Counters, timers and slowest positions as a JSON-serialisable dict."""
+    timers = {}
+    for name, (calls, total, worst) in _timers.items():
+        timers[name] = {"calls": calls, "seconds": total, "max_seconds": worst,
+                        "mean_us": total / calls * 1e6 if calls else 0.0}
+    generations = _timers["generate_valid_moves"][0]
+    derived = {
+        "moves_created_per_generation": _counters["moves_created"] / generations if generations else 0.0,
+        "attack_queries_per_legal_move": (_counters["attack_queries"] / _counters["legal_moves"]
+                                          if _counters["legal_moves"] else 0.0),
+    }
+    return {"time": time.time(), "counters": dict(_counters), "derived": derived, "timers": timers,
+            "slowest": [{"seconds": seconds, "fen": fen} for seconds, fen in sorted(_slowest, reverse=True)]}
+
+
+def format_report(data=None):
+    """Human-readable report of a snapshot (the current one by default)."""
+    data = data or snapshot()
+    lines = ["counters:"]
+    for name, value in data["counters"].items():
+        lines.append(f"  {name:30} {value:>12}")
+    for name, value in data["derived"].items():
+        lines.append(f"  {name:30} {value:>12.2f}")
+    lines.append("timers:                             calls      total s    mean us     max us")
+    for name, timer in data["timers"].items():
+        lines.append(f"  {name:30} {timer['calls']:>10} {timer['seconds']:>12.4f} {timer['mean_us']:>10.1f} "
+                     f"{timer['max_seconds'] * 1e6:>10.1f}")
+    if data["slowest"]:
+        lines.append("slowest move generations:")
+        for entry in data["slowest"]:
+            lines.append(f"  {entry['seconds'] * 1e6:>8.1f} us  {entry['fen']}")
+    return "\n".join(lines)
+
+
+class _Reporter(threading.Thread):
+    def __init__(self, stream, interval):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        self.stream.write(json.dumps(snapshot()) + "\n")
+        self.stream.flush()
+
+
+def start_reporting(stream, interval=10.0):
+    """Append a snapshot to `stream` as a JSON line every `interval` seconds."""
+    global _reporter
+    stop_reporting()
+    _reporter = _Reporter(stream, interval)
+    _reporter.start()
+
+
+def stop_reporting():
+    """Stop periodic reporting, writing one last snapshot."""
+    global _reporter
+    if _reporter is not None:
+        _reporter.stopped.set()
+        _reporter.join()
+        _reporter.write()
+        _reporter = None
@@ -0,0 +1,143 @@
+"""
+Bulk PGN replay validator.
+- games are read lazily and handed to a process pool in chunks; only a few chunks per worker
+  are in flight at once, so memory stays flat on archives with millions of games
+- every SAN move is parsed against get_valid_moves and played with make_move
+- each game reports its plies, the first illegal or unparseable move, the final status
+  and whether that status agrees with the Result tag
+- the summary gives valid/invalid counts and games and plies per second
+
+Usage: python replay.py games.pgn [--workers N] [--chunk N] [--json]
+       (use - to read PGN from stdin; exit status is 1 if any game is invalid)
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from bitboard import BitboardGameState
+from chess_engine import STARTING_FEN
+from pgn import SanError, parse_san, read_games
+
+_worker_state = None
+
+
+def validate_game(game, gs=None):
+    """Replay a PgnGame and return a report dict; `gs` is reused if given."""
+    if gs is None:
+        gs = BitboardGameState()
+    start = time.perf_counter()
+    headers = game.headers
+    report = {"white": headers.get("White", "?"), "black": headers.get("Black", "?"),
+              "result": game.result, "plies": 0}
+    try:
+        gs.load_fen(headers.get("FEN", STARTING_FEN))
+    except ValueError as e:
+        report["error"] = str(e)
+        report["seconds"] = time.perf_counter() - start
+        return report
+    for san in game.san_moves():
+        try:
+            move, promotion = parse_san(gs, san)
+        except SanError as e:
+            report["error"] = f"{e} at ply {report['plies'] + 1}"
+            break
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+        report["plies"] += 1
+    gs.get_valid_moves()
+    status = gs.game_status()
+    report["status"] = status
+    report["fen"] = gs.to_fen()
+    if "error" not in report:
+        if status == "checkmate":
+            report["result_ok"] = game.result == ("0-1" if gs.white_to_move else "1-0")
+        elif status in ("stalemate", "insufficient_material"):
+            report["result_ok"] = game.result == "1/2-1/2"
+        else:
+            # resignations, time forfeits and claimed draws cannot be checked from the moves
+            report["result_ok"] = True
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _validate_chunk(chunk):
+    global _worker_state
+    if _worker_state is None:
+        _worker_state = BitboardGameState()
+    reports = []
+    for index, game in chunk:
+        report = validate_game(game, _worker_state)
+        report["index"] = index
+        reports.append(report)
+    return reports
+
+
+def validate_games(games, processes=None, chunk_size=64, backlog=4):
+    """Yield a report per game, in input order, validating chunks of games in parallel."""
+    processes = processes or os.cpu_count() or 1
+    numbered = enumerate(games, 1)
+    if processes == 1:
+        for chunk in iter(lambda: list(itertools.islice(numbered, chunk_size)), []):
+            yield from _validate_chunk(chunk)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        pending = collections.deque()
+        while True:
+            # Pool.imap would read the whole input ahead of the workers; keep the window bounded
+            while len(pending) < processes * backlog:
+                chunk = list(itertools.islice(numbered, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_validate_chunk, (chunk,)))
+            if not pending:
+                break
+            yield from pending.popleft().get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay and validate every game in a PGN file")
+    parser.add_argument("path", help="PGN file, or - for stdin")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--chunk", type=int, default=64, help="games sent to a worker at a time (default 64)")
+    parser.add_argument("--json", action="store_true", help="write one JSON report per game")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", errors="replace")
+    games = invalid = mismatches = plies = 0
+    start = time.perf_counter()
+    try:
+        for report in validate_games(read_games(source), args.workers, args.chunk):
+            games += 1
+            plies += report["plies"]
+            if "error" in report:
+                invalid += 1
+            elif not report["result_ok"]:
+                mismatches += 1
+            if args.json:
+                sys.stdout.write(json.dumps(report) + "\n")
+            elif "error" in report:
+                print(f"game {report['index']} ({report['white']} - {report['black']}): {report['error']}")
+            elif not report["result_ok"]:
+                print(f"game {report['index']} ({report['white']} - {report['black']}): "
+                      f"ends in {report['status']} but Result is {report['result']}")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    elapsed = time.perf_counter() - start
+    rate = games / elapsed if elapsed > 0 else 0.0
+    ply_rate = plies / elapsed if elapsed > 0 else 0.0
+    print(f"{games} games, {games - invalid} valid, {invalid} invalid, {mismatches} result mismatches; "
+          f"{plies} plies in {elapsed:.2f}s ({rate:.1f} games/s, {ply_rate:.0f} plies/s)",
+          file=sys.stderr if args.json else sys.stdout)
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
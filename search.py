@@ -0,0 +1,418 @@
+"""
+Alpha-beta search engine on top of GameState.
+- negamax with alpha-beta pruning and iterative deepening
+- fixed-size transposition table (depth-preferred replacement, stale entries always replaced)
+- move ordering: TT move, MVV-LVA captures, killer moves, over staged lazy move generation
+- every promotion piece is searched, so underpromotions (e.g. to dodge stalemate) can be played
+- quiescence search over captures and queen promotions; in check it searches every evasion instead
+  of standing pat
+- optional endgame tablebases (see tablebase.py) score covered positions exactly
+- stops on a wall-clock or node budget and reports depth, score, PV and nodes/second
+
+Usage: python search.py [--fen FEN] [--depth N] [--time SECONDS] [--nodes N] [--tablebases DIR] [--profile]
+"""
+
+import argparse
+import sys
+import time
+
+from bitboard import BitboardGameState
+from chess_engine import PROMOTION_TYPES
+import profiling
+from tablebase import Tablebases
+
+MATE_SCORE = 100000
+MAX_PLY = 64
+INFINITY = 10 ** 9
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# piece-square tables from white's point of view, row 0 = rank 8 (same layout as GameState.board)
+PIECE_SQUARE_TABLES = {
+    'p': [[0, 0, 0, 0, 0, 0, 0, 0],
+          [50, 50, 50, 50, 50, 50, 50, 50],
+          [10, 10, 20, 30, 30, 20, 10, 10],
+          [5, 5, 10, 25, 25, 10, 5, 5],
+          [0, 0, 0, 20, 20, 0, 0, 0],
+          [5, -5, -10, 0, 0, -10, -5, 5],
+          [5, 10, 10, -20, -20, 10, 10, 5],
+          [0, 0, 0, 0, 0, 0, 0, 0]],
+    'n': [[-50, -40, -30, -30, -30, -30, -40, -50],
+          [-40, -20, 0, 0, 0, 0, -20, -40],
+          [-30, 0, 10, 15, 15, 10, 0, -30],
+          [-30, 5, 15, 20, 20, 15, 5, -30],
+          [-30, 0, 15, 20, 20, 15, 0, -30],
+          [-30, 5, 10, 15, 15, 10, 5, -30],
+          [-40, -20, 0, 5, 5, 0, -20, -40],
+          [-50, -40, -30, -30, -30, -30, -40, -50]],
+    'b': [[-20, -10, -10, -10, -10, -10, -10, -20],
+          [-10, 0, 0, 0, 0, 0, 0, -10],
+          [-10, 0, 5, 10, 10, 5, 0, -10],
+          [-10, 5, 5, 10, 10, 5, 5, -10],
+          [-10, 0, 10, 10, 10, 10, 0, -10],
+          [-10, 10, 10, 10, 10, 10, 10, -10],
+          [-10, 5, 0, 0, 0, 0, 5, -10],
+          [-20, -10, -10, -10, -10, -10, -10, -20]],
+    'r': [[0, 0, 0, 0, 0, 0, 0, 0],
+          [5, 10, 10, 10, 10, 10, 10, 5],
+          [-5, 0, 0, 0, 0, 0, 0, -5],
+          [-5, 0, 0, 0, 0, 0, 0, -5],
+          [-5, 0, 0, 0, 0, 0, 0, -5],
+          [-5, 0, 0, 0, 0, 0, 0, -5],
+          [-5, 0, 0, 0, 0, 0, 0, -5],
+          [0, 0, 0, 5, 5, 0, 0, 0]],
+    'q': [[-20, -10, -10, -5, -5, -10, -10, -20],
+          [-10, 0, 0, 0, 0, 0, 0, -10],
+          [-10, 0, 5, 5, 5, 5, 0, -10],
+          [-5, 0, 5, 5, 5, 5, 0, -5],
+          [0, 0, 5, 5, 5, 5, 0, -5],
+          [-10, 5, 5, 5, 5, 5, 0, -10],
+          [-10, 0, 5, 0, 0, 0, 0, -10],
+          [-20, -10, -10, -5, -5, -10, -10, -20]],
+    'k': [[-30, -40, -40, -50, -50, -40, -40, -30],
+          [-30, -40, -40, -50, -50, -40, -40, -30],
+          [-30, -40, -40, -50, -50, -40, -40, -30],
+          [-30, -40, -40, -50, -50, -40, -40, -30],
+          [-20, -30, -30, -40, -40, -30, -30, -20],
+          [-10, -20, -20, -20, -20, -20, -20, -10],
+          [20, 20, 0, 0, 0, 0, 20, 20],
+          [20, 30, 10, 0, 0, 10, 30, 20]],
+}
+
+# piece code -> 64 values (value + positional bonus) indexed by row * 8 + col
+PIECE_SQUARE_VALUES = {}
+for _ptype, _table in PIECE_SQUARE_TABLES.items():
+    PIECE_SQUARE_VALUES['w' + _ptype] = [PIECE_VALUES[_ptype] + _table[r][c] for r in range(8) for c in range(8)]
+    PIECE_SQUARE_VALUES['b' + _ptype] = [PIECE_VALUES[_ptype] + _table[7 - r][c] for r in range(8) for c in range(8)]
+
+
+def evaluate(gs):
+    """Material plus piece-square score in centipawns, from the side to move's point of view."""
+    board = gs.board
+    score = 0
+    for r, c in gs.piece_squares['w']:
+        score += PIECE_SQUARE_VALUES[board[r][c]][r * 8 + c]
+    for r, c in gs.piece_squares['b']:
+        score -= PIECE_SQUARE_VALUES[board[r][c]][r * 8 + c]
+    return score if gs.white_to_move else -score
+
+
+def move_notation(move, promotion=None):
+    return move.get_chess_notation() + (promotion or "")
+
+
+class TranspositionTable:
+    """Fixed number of slots indexed by the low bits of the Zobrist key.
+
+    A slot is overwritten when it is empty, holds the same position, was written
+    by an earlier search, or when the new result was searched at least as deep.
+    """
+
+    def __init__(self, size=1 << 18):
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size  # (depth, score, flag, Move.encode() value, age)
+        self.age = 0
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] == key:
+            return self.entries[index]
+        return None
+
+    def store(self, key, depth, score, flag, move_code):
+        index = key & self.mask
+        old = self.entries[index]
+        if old is None or self.keys[index] == key or old[4] != self.age or depth >= old[0]:
+            if move_code is None and old is not None and self.keys[index] == key:
+                move_code = old[3]
+            self.keys[index] = key
+            self.entries[index] = (depth, score, flag, move_code, self.age)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move, promotion, score, depth, pv, nodes, elapsed):
+        self.move = move
+        self.promotion = promotion
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.nps = int(nodes / elapsed) if elapsed > 0 else 0
+
+    def score_string(self):
+        if abs(self.score) >= MATE_SCORE - MAX_PLY:
+            plies = MATE_SCORE - abs(self.score)
+            return "mate " + str((plies + 1) // 2 if self.score > 0 else -((plies + 1) // 2))
+        return "cp " + str(self.score)
+
+    def __str__(self):
+        return (f"depth {self.depth} score {self.score_string()} nodes {self.nodes} "
+                f"nps {self.nps} time {int(self.elapsed * 1000)} pv {' '.join(self.pv)}")
+
+
+class Searcher:
+    def __init__(self, tt=None, tablebases=None):
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.tablebases = tablebases
+        self.nodes = 0
+        self.deadline = None
+        self.node_limit = None
+        self.should_stop = None
+        self.killers = []
+
+    def search(self, gs, depth=None, time_limit=None, node_limit=None, callback=None, should_stop=None):
+        """Iteratively deepen until `depth`, `time_limit` seconds or `node_limit` nodes run out,
+        or until `should_stop()` returns True (polled every 1024 nodes).
+
+        Returns the SearchResult of the last completed iteration (depth 1 always completes).
+        `callback` is called with each iteration's SearchResult.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.node_limit = None
+        self.deadline = None
+        self.should_stop = None
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.tt.new_search()
+        root_length = len(gs.move_log)
+        result = None
+
+        for d in range(1, min(depth or MAX_PLY, MAX_PLY) + 1):
+            if d > 1:
+                self.deadline = start + time_limit if time_limit else None
+                self.node_limit = node_limit
+                self.should_stop = should_stop
+            try:
+                score = self._negamax(gs, d, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                while len(gs.move_log) > root_length:
+                    gs.undo_move()
+                break
+            pv = self._principal_variation(gs, d)
+            entry = self.tt.probe(gs.zobrist_key)
+            if entry and entry[3] is not None:
+                move, promotion = self._find_move(gs.get_valid_moves(), entry[3])
+            else:
+                move, promotion = None, None
+            result = SearchResult(move, promotion, score, d, pv, self.nodes, time.perf_counter() - start)
+            if callback:
+                callback(result)
+            if move is None or abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+            # the next iteration costs several times this one, so don't start what can't finish
+            if time_limit and time.perf_counter() - start > time_limit / 2:
+                break
+        gs.get_valid_moves()
+        return result
+
+    def _tick(self):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            if self.deadline and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.should_stop and self.should_stop():
+                raise SearchTimeout()
+        if self.node_limit and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+
+    def _make(self, gs, move, promotion):
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + (promotion or 'q'))
+
+    def _find_move(self, moves, move_code):
+        move_id = move_code & 0xFFF
+        for mv in moves:
+            if mv.move_id == move_id:
+                return mv, PROMOTION_TYPES[move_code >> 15]
+        return None, None
+
+    def _ordered_moves(self, moves, tt_move, ply):
+        killers = self.killers[ply]
+        scored = []
+        for mv in moves:
+            promotions = ('q', 'r', 'b', 'n') if mv.is_promotion else (None,)
+            for promotion in promotions:
+                if tt_move is not None and mv.encode(promotion) == tt_move:
+                    order = 1000000
+                elif mv.piece_captured != "--":
+                    order = 100000 + 10 * PIECE_VALUES[mv.piece_captured[1]] - PIECE_VALUES[mv.piece_moved[1]]
+                elif promotion:
+                    order = 100000 + PIECE_VALUES[promotion]
+                elif mv.move_id == killers[0] or mv.move_id == killers[1]:
+                    order = 90000
+                else:
+                    order = 0
+                scored.append((order, len(scored), mv, promotion))
+        scored.sort(reverse=True)
+        return [(mv, promotion) for _, _, mv, promotion in scored]
+
+    def _staged_moves(self, gs, tt_move, ply):
+        # ordered one generation stage at a time, so a cutoff skips generating the rest
+        for _, moves in gs.legal_move_stages(tt_move):
+            yield from self._ordered_moves(moves, tt_move, ply)
+
+    def _negamax(self, gs, depth, alpha, beta, ply):
+        self._tick()
+        if ply:
+            if gs.halfmove_clock >= 100 or gs.repetition_counts.get(gs.zobrist_key, 0) >= 2 or gs.insufficient_material():
+                return 0
+            if ply >= MAX_PLY:
+                return evaluate(gs)
+            if self.tablebases and len(gs.piece_squares['w']) + len(gs.piece_squares['b']) <= 3:
+                found = self.tablebases.probe(gs)
+                if found is not None:
+                    wdl, plies = found
+                    return wdl * (MATE_SCORE - ply - plies)
+
+        key = gs.zobrist_key
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry:
+            tt_move = entry[3]
+            if ply and entry[0] >= depth:
+                score = entry[1]
+                if score >= MATE_SCORE - MAX_PLY:
+                    score -= ply
+                elif score <= -MATE_SCORE + MAX_PLY:
+                    score += ply
+                flag = entry[2]
+                if flag == EXACT or (flag == LOWER_BOUND and score >= beta) or (flag == UPPER_BOUND and score <= alpha):
+                    return score
+
+        if depth <= 0:
+            return self._quiesce(gs, alpha, beta, ply)
+
+        alpha_orig = alpha
+        best_score = -INFINITY
+        best_move = None
+        for mv, promotion in self._staged_moves(gs, tt_move, ply):
+            self._make(gs, mv, promotion)
+            score = -self._negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if score > best_score:
+                best_score = score
+                best_move = mv.encode(promotion)
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if mv.piece_captured == "--" and not promotion:
+                    killers = self.killers[ply]
+                    if killers[0] != mv.move_id:
+                        killers[1] = killers[0]
+                        killers[0] = mv.move_id
+                break
+        if best_move is None:
+            return -MATE_SCORE + ply if gs.check else 0
+
+        if best_score <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        stored = best_score
+        if stored >= MATE_SCORE - MAX_PLY:
+            stored += ply
+        elif stored <= -MATE_SCORE + MAX_PLY:
+            stored -= ply
+        self.tt.store(key, depth, stored, flag, best_move)
+        return best_score
+
+    def _quiesce(self, gs, alpha, beta, ply):
+        self._tick()
+        if ply >= MAX_PLY:
+            return evaluate(gs)
+        in_check = gs.in_check()
+        if not in_check:
+            stand_pat = evaluate(gs)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+        stages = gs.legal_move_stages()
+        next(stages)  # no hash move in quiescence
+        _, moves = next(stages)
+        if in_check:
+            # a quiet position can't be assumed while in check, so every evasion is searched
+            moves = moves + [mv for _, stage in stages for mv in stage]
+            if not moves:
+                return -MATE_SCORE + ply
+        elif not moves and not gs.has_legal_move():
+            return 0
+        for mv, promotion in self._ordered_moves(moves, None, ply):
+            if promotion not in (None, 'q') and not in_check:
+                continue
+            self._make(gs, mv, promotion)
+            score = -self._quiesce(gs, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _principal_variation(self, gs, depth):
+        pv = []
+        seen = set()
+        for _ in range(depth):
+            entry = self.tt.probe(gs.zobrist_key)
+            if not entry or entry[3] is None or gs.zobrist_key in seen:
+                break
+            seen.add(gs.zobrist_key)
+            move, promotion = self._find_move(gs.get_valid_moves(), entry[3])
+            if move is None:
+                break
+            pv.append(move_notation(move, promotion))
+            self._make(gs, move, promotion)
+        for _ in pv:
+            gs.undo_move()
+        return pv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position with the built-in engine")
+    parser.add_argument("--fen", help="position to search (default: initial position)")
+    parser.add_argument("--depth", type=int, help="maximum depth")
+    parser.add_argument("--time", type=float, help="time budget in seconds")
+    parser.add_argument("--nodes", type=int, help="node budget")
+    parser.add_argument("--tt-size", type=int, default=1 << 18, help="transposition table slots")
+    parser.add_argument("--tablebases", help="directory of tablebase files from tablebase.py")
+    parser.add_argument("--profile", action="store_true", help="print instrumentation counters and timings")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
+
+    gs = BitboardGameState()
+    if args.fen:
+        gs.load_fen(args.fen)
+    depth = args.depth if args.depth or args.time or args.nodes else 4
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    result = Searcher(TranspositionTable(args.tt_size), tablebases).search(
+        gs, depth=depth, time_limit=args.time, node_limit=args.nodes, callback=lambda info: print("info", info))
+    if result and result.move:
+        print("bestmove", move_notation(result.move, result.promotion))
+    else:
+        print("bestmove (none)")
+    if args.profile:
+        print(profiling.format_report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
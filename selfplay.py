@@ -0,0 +1,254 @@
+"""
+Headless engine-versus-engine matches.
+- players: "random", "depth:N", "time:SECONDS" or "nodes:N"
+- games run in a process pool; each worker keeps one searcher (and transposition table) per player
+- openings come from an optional file of FENs; each opening is played twice with colors swapped
+- an optional opening book (see opening_book.py) supplies moves for both players while in book
+- games end on checkmate, stalemate, insufficient material, the 50-move rule, threefold
+  repetition or a ply limit
+- reports W/D/L for the first player, an Elo estimate, games/second and nodes per move
+
+Usage: python selfplay.py PLAYER_A PLAYER_B [--games N] [--workers N] [--openings FILE] [--book FILE]
+                          [--pgn FILE]
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from bitboard import BitboardGameState
+from chess_engine import STARTING_FEN
+from opening_book import OpeningBook
+from pgn import move_to_san
+from search import Searcher, TranspositionTable
+
+_worker_players = {}
+_worker_books = {}
+
+
+class Player:
+    def __init__(self, spec, tt_size=1 << 16):
+        kind, _, value = spec.partition(":")
+        if kind == "random" and not value:
+            self.limits = None
+        elif kind in ("depth", "nodes") and value.isdigit():
+            # the searcher reads a limit of 0 as "no limit", so it is not a valid budget here
+            if int(value) < 1:
+                raise ValueError("bad player: %s (%s must be at least 1)" % (spec, kind))
+            self.limits = {"depth" if kind == "depth" else "node_limit": int(value)}
+        elif kind == "time":
+            try:
+                self.limits = {"time_limit": float(value)}
+            except ValueError:
+                raise ValueError("bad player: " + spec) from None
+            if not self.limits["time_limit"] > 0:
+                raise ValueError("bad player: %s (time must be positive)" % spec)
+        else:
+            raise ValueError("bad player: " + spec)
+        self.spec = spec
+        self.searcher = Searcher(TranspositionTable(tt_size)) if self.limits else None
+        self.rng = random.Random()
+
+    def new_game(self, seed):
+        self.rng.seed(seed)
+        if self.searcher:
+            self.searcher.tt.clear()
+
+    def choose(self, gs):
+        """Return (move, promotion type or None, nodes searched)."""
+        if self.searcher is None:
+            move = self.rng.choice(gs.get_valid_moves())
+            return move, self.rng.choice("qrbn") if move.is_promotion else None, 0
+        result = self.searcher.search(gs, **self.limits)
+        # searcher.nodes also counts the iteration cut short by the time or node budget
+        return result.move, result.promotion, self.searcher.nodes
+
+
+def _player(spec, color):
+    # keyed by color too, so a player never shares a transposition table with its opponent
+    if (spec, color) not in _worker_players:
+        _worker_players[spec, color] = Player(spec)
+    return _worker_players[spec, color]
+
+
+def _book(path):
+    if path not in _worker_books:
+        _worker_books[path] = OpeningBook(path)
+    return _worker_books[path]
+
+
+def play_game(task):
+    """Play one game; `task` is (index, fen, white spec, black spec, seed, max plies, record SAN,
+    book path or None)."""
+    index, fen, white_spec, black_spec, seed, max_plies, record, book_path = task
+    white, black = _player(white_spec, "w"), _player(black_spec, "b")
+    book = _book(book_path) if book_path else None
+    book_rng = random.Random(seed)
+    book_moves = 0
+    white.new_game(seed)
+    black.new_game(seed + 1)
+    gs = BitboardGameState.from_fen(fen)
+    nodes = {"w": 0, "b": 0}
+    moves_made = {"w": 0, "b": 0}
+    san_moves = []
+    start = time.perf_counter()
+    # searching players generate their own moves, so the game loop only needs to know whether any exist
+    gs.has_legal_move()
+    status = gs.game_status()
+    while status == "ongoing" and len(gs.move_log) < max_plies:
+        color = "w" if gs.white_to_move else "b"
+        choice = book.choose(gs, rng=book_rng) if book and book_moves == len(gs.move_log) else None
+        if choice:
+            move, promotion = choice
+            book_moves += 1
+        else:
+            move, promotion, searched = (white if color == "w" else black).choose(gs)
+            nodes[color] += searched
+            moves_made[color] += 1
+        if record:
+            san_moves.append(move_to_san(gs, move, promotion))
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + (promotion or 'q'))
+        gs.has_legal_move()
+        status = gs.game_status()
+    if status == "checkmate":
+        result = "0-1" if gs.white_to_move else "1-0"
+    elif status == "ongoing":
+        status, result = "max_plies", "1/2-1/2"
+    else:
+        result = "1/2-1/2"
+    return {"index": index, "fen": fen, "white": white_spec, "black": black_spec, "result": result,
+            "reason": status, "plies": len(gs.move_log), "nodes": nodes, "moves": moves_made,
+            "book_moves": book_moves, "seconds": time.perf_counter() - start, "san": san_moves}
+
+
+def game_tasks(player_a, player_b, games, openings, seed=0, max_plies=400, record=False, book_path=None):
+    """One task per game; consecutive pairs share an opening (and book line) with colors swapped."""
+    for index in range(games):
+        fen = openings[index // 2 % len(openings)]
+        white, black = (player_a, player_b) if index % 2 == 0 else (player_b, player_a)
+        yield index, fen, white, black, seed + 2 * (index // 2), max_plies, record, book_path
+
+
+def run_match(player_a, player_b, games, openings=(STARTING_FEN,), processes=None, seed=0,
+              max_plies=400, record=False, book_path=None):
+    """Yield game reports as they finish (not in index order)."""
+    for spec in (player_a, player_b):
+        Player(spec, tt_size=1)  # validate specs before starting workers
+    if book_path:
+        OpeningBook(book_path).close()
+    tasks = game_tasks(player_a, player_b, games, list(openings), seed, max_plies, record, book_path)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        yield from map(play_game, tasks)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(play_game, tasks)
+
+
+def elo_difference(score):
+    """Elo difference implied by a score fraction (None at 0% or 100%)."""
+    if score <= 0 or score >= 1:
+        return None
+    return -400 * math.log10(1 / score - 1)
+
+
+def write_pgn(out, report, round_number):
+    tags = [("Event", "selfplay"), ("Round", str(round_number)), ("White", report["white"]),
+            ("Black", report["black"]), ("Result", report["result"]), ("Termination", report["reason"])]
+    if report["fen"] != STARTING_FEN:
+        tags += [("SetUp", "1"), ("FEN", report["fen"])]
+    for name, value in tags:
+        out.write(f'[{name} "{value}"]\n')
+    gs = BitboardGameState.from_fen(report["fen"])
+    number, black_first = gs.fullmove_number, not gs.white_to_move
+    tokens = [f"{number}..."] if black_first else []
+    for ply, san in enumerate(report["san"]):
+        if (ply % 2 == 0) != black_first:
+            tokens.append(f"{number + (ply + black_first) // 2}.")
+        tokens.append(san)
+    tokens.append(report["result"])
+    out.write("\n" + " ".join(tokens) + "\n\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine-versus-engine matches without the UI")
+    parser.add_argument("player_a", help="random, depth:N, time:SECONDS or nodes:N")
+    parser.add_argument("player_b", help="random, depth:N, time:SECONDS or nodes:N")
+    parser.add_argument("--games", type=int, default=10, help="number of games (default 10)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--openings", help="file with one starting FEN per line")
+    parser.add_argument("--max-plies", type=int, default=400, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random players")
+    parser.add_argument("--book", help="opening book file built with opening_book.py")
+    parser.add_argument("--pgn", help="write the games to this PGN file")
+    parser.add_argument("--json", action="store_true", help="write one JSON report per game")
+    args = parser.parse_args(argv)
+
+    openings = [STARTING_FEN]
+    if args.openings:
+        with open(args.openings) as f:
+            openings = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    try:
+        for fen in openings:
+            BitboardGameState.from_fen(fen)
+        for spec in (args.player_a, args.player_b):
+            Player(spec, tt_size=1)
+        if args.book:
+            OpeningBook(args.book).close()
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    wins = draws = losses = plies = 0
+    nodes = [0, 0]  # player a, player b
+    moves = [0, 0]
+    reasons = {}
+    pgn_out = open(args.pgn, "w") if args.pgn else None
+    start = time.perf_counter()
+    for report in run_match(args.player_a, args.player_b, args.games, openings, args.workers,
+                            args.seed, args.max_plies, record=bool(args.pgn), book_path=args.book):
+        a_color = "w" if report["index"] % 2 == 0 else "b"
+        if report["result"] == "1/2-1/2":
+            draws += 1
+        elif (report["result"] == "1-0") == (a_color == "w"):
+            wins += 1
+        else:
+            losses += 1
+        plies += report["plies"]
+        reasons[report["reason"]] = reasons.get(report["reason"], 0) + 1
+        for player, color in enumerate((a_color, "b" if a_color == "w" else "w")):
+            nodes[player] += report["nodes"][color]
+            moves[player] += report["moves"][color]
+        if pgn_out:
+            write_pgn(pgn_out, report, report["index"] + 1)
+        if args.json:
+            report.pop("san")
+            print(json.dumps(report))
+            sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+    if pgn_out:
+        pgn_out.close()
+
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games if games else 0.0
+    elo = elo_difference(score)
+    out = sys.stderr if args.json else sys.stdout
+    print(f"{args.player_a} vs {args.player_b}: +{wins} ={draws} -{losses} "
+          f"score {score:.3f}" + (f" elo {elo:+.0f}" if elo is not None else ""), file=out)
+    print(f"{games} games, {plies} plies in {elapsed:.2f}s ({games / elapsed if elapsed else 0:.2f} games/s)",
+          file=out)
+    print("endings: " + ", ".join(f"{reason} {count}" for reason, count in sorted(reasons.items())), file=out)
+    for player, spec in enumerate((args.player_a, args.player_b)):
+        per_move = nodes[player] / moves[player] if moves[player] else 0.0
+        print(f"{spec}: {per_move:.0f} nodes/move", file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Headless multi-game server: many concurrent games on one asyncio event loop.
+- TCP on localhost, one JSON object per line in each direction; a request's "id" is echoed in
+  its response (engine replies can overtake later requests on the same connection)
+- ops: new [fen], move game move, undo game, moves game, status game,
+  engine game [depth|time|nodes] [play], close game, stats
+- moves are in coordinate notation ("e2e4", "e7e8q"); errors come back as {"ok": false, "error": ...}
+- request lines longer than MAX_LINE bytes are skipped and answered with a "line too long" error
+- a session stores only its starting FEN and an array of Move.encode codes; at most --live
+  sessions also keep a BitboardGameState (LRU), the others are replayed from their codes when used
+- sessions idle for --idle seconds are evicted
+- engine searches run in a process pool, so the event loop never waits on the engine
+
+Usage: python server.py [--port N] [--engine-workers N] [--live N] [--idle SECONDS] [--max-sessions N]
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+from bitboard import BitboardGameState
+from chess_engine import STARTING_FEN
+from engine_worker import replay_game
+from search import Searcher, move_notation
+
+MAX_ENGINE_DEPTH = 8
+MAX_LINE = 1 << 16  # longest request line; longer ones are skipped with a "line too long" error
+
+_searcher = None  # per engine process
+
+
+class RequestError(Exception):
+    pass
+
+
+class Session:
+    __slots__ = ("id", "fen", "moves", "version", "last_used", "gs")
+
+    def __init__(self, session_id, fen):
+        self.id = session_id
+        self.fen = fen
+        self.moves = array('I')  # Move.encode codes, promotion choice included
+        self.version = 0  # bumped by every move and undo
+        self.last_used = time.monotonic()
+        self.gs = None
+
+
+class SessionStore:
+    def __init__(self, max_live=4096, idle_timeout=600.0, max_sessions=100000):
+        self.sessions = {}
+        self.live = OrderedDict()  # session id -> None, least recently used first
+        self.max_live = max_live
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.next_id = 1
+        self.created = 0
+        self.evicted = 0
+        self.replays = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def create(self, fen=None):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("too many sessions")
+        if fen is not None and not isinstance(fen, str):
+            raise RequestError("bad fen: %r" % (fen,))
+        session = Session(self.next_id, fen or STARTING_FEN)
+        gs = self._free_state()
+        try:
+            gs.load_fen(session.fen)
+        except ValueError as exc:
+            raise RequestError(str(exc)) from None
+        self.next_id += 1
+        self.created += 1
+        self.sessions[session.id] = session
+        self._attach(session, gs)
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id) if isinstance(session_id, int) else None
+        if session is None:
+            raise RequestError("no such game: %r" % (session_id,))
+        session.last_used = time.monotonic()
+        return session
+
+    def state(self, session):
+        """The session's GameState, rebuilt from its moves if it was dropped from the live set."""
+        if session.gs is not None:
+            self.live.move_to_end(session.id)
+            return session.gs
+        self.replays += 1
+        gs = replay_game(session.moves, session.fen, self._free_state())
+        self._attach(session, gs)
+        return gs
+
+    def close(self, session):
+        del self.sessions[session.id]
+        self.discard_state(session)
+
+    def discard_state(self, session):
+        """Drop the session's GameState; the next request rebuilds it from the moves."""
+        if session.gs is not None:
+            del self.live[session.id]
+            session.gs = None
+
+    def evict_idle(self, now=None):
+        """Forget sessions unused for idle_timeout seconds; returns how many went."""
+        cutoff = (now if now is not None else time.monotonic()) - self.idle_timeout
+        idle = [session for session in self.sessions.values() if session.last_used < cutoff]
+        for session in idle:
+            self.close(session)
+        self.evicted += len(idle)
+        return len(idle)
+
+    def _attach(self, session, gs):
+        session.gs = gs
+        self.live[session.id] = None
+
+    def _free_state(self):
+        # reuse the GameState of the least recently used live session once the live set is full
+        if len(self.live) < self.max_live:
+            gs = BitboardGameState()
+            gs.set_move_cache_size(2)  # enough for a "moves" request followed by a "move"
+            return gs
+        session_id, _ = self.live.popitem(last=False)
+        session = self.sessions[session_id]
+        gs, session.gs = session.gs, None
+        return gs
+
+
+def _engine_search(fen, codes, limits):
+    """Runs in a pool process: (move code, notation, score, depth, nodes) or None."""
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    gs = replay_game(codes, fen)
+    result = _searcher.search(gs, **limits)
+    if result is None or result.move is None:
+        return None
+    return (result.move.encode(result.promotion), move_notation(result.move, result.promotion),
+            result.score, result.depth, result.nodes)
+
+
+def _position(gs):
+    gs.has_legal_move()
+    return {"fen": gs.to_fen(), "status": gs.game_status(), "check": gs.check,
+            "turn": "w" if gs.white_to_move else "b", "plies": len(gs.move_log)}
+
+
+def _find_move(gs, text):
+    if not isinstance(text, str) or len(text) not in (4, 5):
+        raise RequestError("bad move: %r" % (text,))
+    suffix = text[4:]
+    for move in gs.get_valid_moves():
+        if move_notation(move) == text[:4]:
+            if not move.is_promotion:
+                if suffix:
+                    break
+                return move, None
+            if suffix and suffix not in ('q', 'r', 'b', 'n'):
+                break
+            return move, suffix or 'q'
+    raise RequestError("illegal move: " + text)
+
+
+def _check_ongoing(gs):
+    gs.has_legal_move()
+    status = gs.game_status()
+    if status != "ongoing":
+        raise RequestError("game over: " + status)
+
+
+class _Replies:
+    """Responses for one connection, written together once per event-loop pass (one send call
+    for all the requests that arrived in the same read)."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = []
+
+    def send(self, response):
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.pending.append(json.dumps(response, separators=(",", ":")))
+
+    def flush(self):
+        if self.pending and not self.writer.is_closing():
+            self.writer.write(("\n".join(self.pending) + "\n").encode())
+        self.pending = []
+
+
+async def _read_line(reader):
+    """The next line (b"" at end of stream), or None if it exceeds the reader's limit; the
+    over-long line is then discarded, so the connection stays usable."""
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+            return None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+class GameServer:
+    def __init__(self, store, executor, max_engine_time=5.0):
+        self.store = store
+        self.executor = executor
+        self.max_engine_time = max_engine_time
+        self.connections = 0
+        self.requests = 0
+        self.engine_pending = 0
+        self.errors = 0
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        replies = _Replies(writer)
+        tasks = set()
+        try:
+            while True:
+                line = await _read_line(reader)
+                if line is None:
+                    replies.send({"ok": False, "error": "line too long"})
+                    continue
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    replies.send({"ok": False, "error": "bad request"})
+                    continue
+                if request.get("op") == "engine":
+                    task = asyncio.ensure_future(self._reply_later(replies, request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    replies.send(self.handle(request))
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _reply_later(self, replies, request):
+        replies.send(await self.handle_engine(request))
+
+    def handle(self, request):
+        """Answer one non-engine request."""
+        self.requests += 1
+        response = {"id": request.get("id"), "ok": True}
+        op = request.get("op")
+        session = None
+        try:
+            if op == "new":
+                session = self.store.create(request.get("fen"))
+                response["game"] = session.id
+                response.update(_position(session.gs))
+            elif op == "stats":
+                response.update(self.stats())
+            elif op in ("move", "undo", "moves", "status", "close"):
+                session = self.store.get(request.get("game"))
+                if op == "close":
+                    self.store.close(session)
+                    return response
+                gs = self.store.state(session)
+                if op == "move":
+                    _check_ongoing(gs)
+                    move, promotion = _find_move(gs, request.get("move"))
+                    self._play(session, gs, move, promotion)
+                elif op == "undo":
+                    if not session.moves:
+                        raise RequestError("nothing to undo")
+                    session.moves.pop()
+                    session.version += 1
+                    gs.undo_move()
+                elif op == "moves":
+                    response["moves"] = sorted(
+                        move_notation(move, p) for move in gs.get_valid_moves()
+                        for p in (('q', 'r', 'b', 'n') if move.is_promotion else (None,)))
+                response.update(_position(gs))
+            else:
+                raise RequestError("unknown op: %r" % (op,))
+        except RequestError as exc:
+            return {"id": request.get("id"), "ok": False, "error": str(exc)}
+        except Exception as exc:
+            return self._internal_error(request, session, exc)
+        return response
+
+    async def handle_engine(self, request):
+        """Search the game's position in the process pool; with "play", also make the move."""
+        self.requests += 1
+        session = None
+        try:
+            session = self.store.get(request.get("game"))
+            limits = self._engine_limits(request)
+            _check_ongoing(self.store.state(session))
+        except RequestError as exc:
+            return {"id": request.get("id"), "ok": False, "error": str(exc)}
+        except Exception as exc:
+            return self._internal_error(request, session, exc)
+        version = session.version
+        self.engine_pending += 1
+        try:
+            found = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _engine_search, session.fen, session.moves.tolist(), limits)
+        except Exception as exc:
+            return self._internal_error(request, None, exc)
+        finally:
+            self.engine_pending -= 1
+        response = {"id": request.get("id"), "ok": True, "move": None}
+        if found is None:
+            return response
+        code, notation, score, depth, nodes = found
+        response.update({"move": notation, "score": score, "depth": depth, "nodes": nodes})
+        if request.get("play"):
+            if self.store.sessions.get(session.id) is not session or session.version != version:
+                return {"id": request.get("id"), "ok": False, "error": "position changed during search"}
+            try:
+                gs = self.store.state(session)
+                move, promotion = _find_move(gs, notation)
+                self._play(session, gs, move, promotion)
+                response.update(_position(gs))
+            except RequestError as exc:
+                return {"id": request.get("id"), "ok": False, "error": str(exc)}
+            except Exception as exc:
+                return self._internal_error(request, session, exc)
+        return response
+
+    def _internal_error(self, request, session, exc):
+        # the GameState may be half-updated; rebuild it from the recorded moves on next use
+        if session is not None and self.store.sessions.get(session.id) is session:
+            self.store.discard_state(session)
+        self.errors += 1
+        return {"id": request.get("id"), "ok": False, "error": "internal error: %s: %s" % (type(exc).__name__, exc)}
+
+    def _engine_limits(self, request):
+        try:
+            if request.get("time") is not None:
+                return {"time_limit": min(float(request["time"]), self.max_engine_time)}
+            if request.get("nodes") is not None:
+                return {"node_limit": int(request["nodes"]), "time_limit": self.max_engine_time}
+            return {"depth": max(1, min(int(request.get("depth", 3)), MAX_ENGINE_DEPTH)),
+                    "time_limit": self.max_engine_time}
+        except (TypeError, ValueError):
+            raise RequestError("bad engine limits") from None
+
+    def _play(self, session, gs, move, promotion):
+        gs.make_move(move)
+        if gs.pawn_promotion:
+            gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+        session.moves.append(move.encode(promotion))
+        session.version += 1
+
+    def stats(self):
+        return {"sessions": len(self.store), "live": len(self.store.live), "created": self.store.created,
+                "evicted": self.store.evicted, "replays": self.store.replays, "connections": self.connections,
+                "requests": self.requests, "engine_pending": self.engine_pending, "errors": self.errors}
+
+    async def evict_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.store.evict_idle()
+
+
+async def serve(host, port, store, engine_workers, max_engine_time):
+    with concurrent.futures.ProcessPoolExecutor(engine_workers) as executor:
+        game_server = GameServer(store, executor, max_engine_time)
+        server = await asyncio.start_server(game_server.handle_client, host, port, limit=MAX_LINE)
+        evictor = asyncio.ensure_future(game_server.evict_periodically(max(1.0, store.idle_timeout / 4)))
+        print(f"listening on {host}:{port}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many concurrent games over a JSON-lines TCP protocol")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port (default 8765)")
+    parser.add_argument("--engine-workers", type=int, default=os.cpu_count() or 1,
+                        help="engine processes (default: one per core)")
+    parser.add_argument("--max-engine-time", type=float, default=5.0, help="seconds cap per engine request")
+    parser.add_argument("--live", type=int, default=4096, help="sessions kept as GameState objects (default 4096)")
+    parser.add_argument("--idle", type=float, default=600.0, help="evict sessions idle this many seconds")
+    parser.add_argument("--max-sessions", type=int, default=100000, help="refuse new games beyond this")
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.live, args.idle, args.max_sessions)
+    try:
+        asyncio.run(serve(args.host, args.port, store, args.engine_workers, args.max_engine_time))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Pre-scaled piece sprite atlas for the pygame front end.
+- the twelve piece PNGs are scaled once to the square size and packed side by side in one surface
+- the atlas is cached next to the images as raw RGBA (images/atlas_<size>.raw), so later starts
+  read one file instead of decoding and rescaling twelve PNGs
+- the cache is rebuilt when the square size or any source PNG (size or mtime) changes
+"""
+
+import os
+import struct
+import zlib
+
+import pygame
+
+PIECES = ["wp", "wr", "wn", "wb", "wq", "wk", "bp", "br", "bn", "bb", "bq", "bk"]
+MAGIC = b"CHESSSPR"
+HEADER = struct.Struct(">8sHHHI")  # magic, square size, atlas width, atlas height, source signature
+
+
+class SpriteAtlas:
+    def __init__(self, surface, size):
+        self.surface = surface
+        self.size = size
+        self.rects = {piece: pygame.Rect(i * size, 0, size, size) for i, piece in enumerate(PIECES)}
+
+    def blit(self, target, piece, dest):
+        target.blit(self.surface, dest, self.rects[piece])
+
+
+def cache_path(image_dir, size):
+    return os.path.join(image_dir, "atlas_%d.raw" % size)
+
+
+def _signature(image_dir):
+    parts = []
+    for piece in PIECES:
+        stat = os.stat(os.path.join(image_dir, piece + ".png"))
+        parts.append("%s:%d:%d" % (piece, stat.st_size, stat.st_mtime_ns))
+    return zlib.crc32(",".join(parts).encode())
+
+
+def build_atlas(image_dir, size):
+    """Decode and scale every piece image into one atlas surface."""
+    atlas = pygame.Surface((size * len(PIECES), size), pygame.SRCALPHA)
+    for i, piece in enumerate(PIECES):
+        image = pygame.image.load(os.path.join(image_dir, piece + ".png"))
+        atlas.blit(pygame.transform.scale(image, (size, size)), (i * size, 0))
+    return atlas
+
+
+def _read_cache(path, size, signature):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, cached_size, width, height, cached_signature = HEADER.unpack_from(data)
+    if (magic != MAGIC or cached_size != size or cached_signature != signature
+            or len(data) != HEADER.size + width * height * 4):
+        return None
+    return pygame.image.frombuffer(data[HEADER.size:], (width, height), "RGBA")
+
+
+def _write_cache(path, surface, size, signature):
+    width, height = surface.get_size()
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, size, width, height, signature))
+            out.write(pygame.image.tobytes(surface, "RGBA"))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # a read-only install just rebuilds the atlas on every start
+
+
+def load_atlas(image_dir, size):
+    """SpriteAtlas for `size`-pixel squares: read from the raw cache when it is current,
+    otherwise built from the PNGs and cached. Converted to the display format once a display
+    mode is set."""
+    signature = _signature(image_dir)
+    path = cache_path(image_dir, size)
+    surface = _read_cache(path, size, signature)
+    if surface is None:
+        surface = build_atlas(image_dir, size)
+        _write_cache(path, surface, size, signature)
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert_alpha()
+    return SpriteAtlas(surface, size)
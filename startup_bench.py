@@ -0,0 +1,108 @@
+"""
+Startup benchmark for the engine and the pygame front end.
+- every measurement runs in a fresh interpreter, timed from process launch to exit
+- engine-only imports (chess_engine, search, engine_worker, main) must not load pygame
+- time to first frame of main.py with a cold (deleted) and a warm sprite atlas cache
+- in-process: building the atlas from the PNGs versus loading the raw cache
+- uses SDL's dummy video driver unless --display is given
+
+Usage: python startup_bench.py [--runs N] [--display] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_CHECK = "import sys, {module}; sys.exit('pygame' in sys.modules)"
+FIRST_FRAME = "import main; main.main(max_frames=1)"
+
+
+def _timed_run(code, env):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return time.perf_counter() - start, completed
+
+
+def measure(code, env, runs, before=None):
+    """Median and best wall seconds over `runs` fresh interpreters, plus the last exit status."""
+    times = []
+    status = 0
+    for _ in range(runs):
+        if before:
+            before()
+        elapsed, completed = _timed_run(code, env)
+        times.append(elapsed)
+        status = completed.returncode
+        if status and completed.stderr:
+            sys.stderr.write(completed.stderr.decode(errors="replace"))
+    return {"median": statistics.median(times), "best": min(times), "status": status}
+
+
+def atlas_timings(runs):
+    import pygame
+    import main
+    import sprites
+    pygame.init()
+    build, load = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        sprites.build_atlas("images", main.SQ_SIZE)
+        build.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        sprites.load_atlas("images", main.SQ_SIZE)
+        load.append(time.perf_counter() - start)
+    pygame.quit()
+    return {"build_png": statistics.median(build), "load_cached": statistics.median(load)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure engine import and first-frame startup times")
+    parser.add_argument("--runs", type=int, default=5, help="runs per measurement (default 5)")
+    parser.add_argument("--display", action="store_true", help="open a real window instead of SDL's dummy driver")
+    parser.add_argument("--json", action="store_true", help="print one JSON object")
+    args = parser.parse_args(argv)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    if not args.display:
+        env["SDL_VIDEODRIVER"] = "dummy"
+    os.environ.update(env)
+
+    import main as front_end
+    import sprites
+    atlas_file = sprites.cache_path("images", front_end.SQ_SIZE)
+
+    def remove_atlas():
+        if os.path.exists(atlas_file):
+            os.remove(atlas_file)
+
+    results = {"interpreter": measure("pass", env, args.runs)}
+    for module in ("chess_engine", "search", "engine_worker", "main"):
+        results["import " + module] = measure(IMPORT_CHECK.format(module=module), env, args.runs)
+    results["first frame (cold atlas)"] = measure(FIRST_FRAME, env, args.runs, before=remove_atlas)
+    results["first frame (warm atlas)"] = measure(FIRST_FRAME, env, args.runs)
+    atlas = atlas_timings(args.runs)
+
+    if args.json:
+        print(json.dumps({"runs": args.runs, "processes": results, "atlas": atlas}))
+    else:
+        for name, result in results.items():
+            note = ""
+            if name.startswith("import"):
+                note = "  pygame loaded!" if result["status"] else "  (no pygame)"
+            elif result["status"]:
+                note = "  FAILED"
+            print(f"{name:26} median {result['median'] * 1000:8.1f} ms  best {result['best'] * 1000:8.1f} ms{note}")
+        print(f"{'atlas from PNGs':26} median {atlas['build_png'] * 1000:8.1f} ms")
+        print(f"{'atlas from raw cache':26} median {atlas['load_cached'] * 1000:8.1f} ms")
+    failed = any(result["status"] for result in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Endgame tablebases for king + queen, rook or pawn against a lone king (KQK, KRK, KPK).
+- generated by retrograde analysis: start from every checkmate and walk moves backwards,
+  so each position is resolved once, at its exact distance to mate
+- one byte per position: 0 = draw, 255 = illegal, otherwise distance to mate in plies + 1
+- stored symmetry-reduced (white king in the a1-d1-d4 triangle without pawns, pawn on files
+  a-d in KPK) and read back through mmap
+- positions with the black side stronger are probed with colors flipped
+- probe() gives (win/draw/loss for the side to move, plies to mate); best_move() plays it out
+
+Usage: python tablebase.py generate [--dir DIR]
+       python tablebase.py probe --fen FEN [--dir DIR]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from bitboard import KING_ATTACKS, PAWN_ATTACKS, queen_attacks, rook_attacks
+from chess_engine import GameState
+
+TABLES = ("KQK", "KRK", "KPK")  # KPK promotes into the other two, so it is generated last
+MAGIC = b"CHESSTB1"
+HEADER = struct.Struct(">8s4s")  # magic, material name
+DRAW, ILLEGAL = 0, 255
+WHITE, BLACK = 0, 1
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+_PIECE_ATTACKS = {
+    "KQK": queen_attacks,
+    "KRK": rook_attacks,
+    "KPK": lambda sq, occupied: PAWN_ATTACKS['w'][sq],
+}
+
+
+def _square_transforms():
+    transforms = []
+    for flip_rows in (False, True):
+        for flip_cols in (False, True):
+            for transpose in (False, True):
+                table = []
+                for sq in range(64):
+                    r, c = divmod(sq, 8)
+                    if flip_rows:
+                        r = 7 - r
+                    if flip_cols:
+                        c = 7 - c
+                    if transpose:
+                        r, c = c, r
+                    table.append(r * 8 + c)
+                transforms.append(table)
+    return transforms
+
+
+TRANSFORMS = _square_transforms()
+MIRROR_FILES = [sq // 8 * 8 + 7 - sq % 8 for sq in range(64)]
+FLIP_RANKS = [(7 - sq // 8) * 8 + sq % 8 for sq in range(64)]
+# white king squares of the a1-d1-d4 triangle (row 7 is rank 1)
+TRIANGLE = [sq for sq in range(64) if sq % 8 <= 3 and 7 - sq // 8 <= sq % 8]
+TRIANGLE_INDEX = {sq: i for i, sq in enumerate(TRIANGLE)}
+# for each white king square, a transform that takes it into the triangle
+TRIANGLE_TRANSFORM = [next(t for t in TRANSFORMS if t[sq] in TRIANGLE_INDEX) for sq in range(64)]
+# KPK pawn squares: files a-d, ranks 2-7
+PAWN_SQUARES = [sq for sq in range(8, 56) if sq % 8 <= 3]
+PAWN_INDEX = {sq: i for i, sq in enumerate(PAWN_SQUARES)}
+
+
+def _index(stm, wk, bk, piece):
+    return ((stm * 64 + wk) * 64 + bk) * 64 + piece
+
+
+def _white_attacks(material, wk, piece, occupied):
+    return KING_ATTACKS[wk] | _PIECE_ATTACKS[material](piece, occupied)
+
+
+def _legal(material, stm, wk, bk, piece):
+    if wk == bk or piece == wk or piece == bk or KING_ATTACKS[wk] >> bk & 1:
+        return False
+    if material == "KPK" and not 8 <= piece < 56:
+        return False
+    # with white to move, black must not be in check
+    return stm == BLACK or not _white_attacks(material, wk, piece, 1 << wk | 1 << piece) >> bk & 1
+
+
+def _black_moves(material, wk, bk, piece):
+    """(squares the black king can move to, in check, can capture the white piece)."""
+    attacks = _white_attacks(material, wk, piece, 1 << wk | 1 << piece)
+    in_check = bool(attacks >> bk & 1)
+    moves = KING_ATTACKS[bk] & ~attacks & ~(1 << wk)
+    capture = bool(moves >> piece & 1)
+    return moves & ~(1 << piece), in_check, capture
+
+
+def _squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _piece_unmoves(material, wk, bk, piece):
+    """Squares the white piece can have come from."""
+    occupied = 1 << wk | 1 << bk
+    if material == "KPK":
+        sources = []
+        if piece + 8 < 56 and not occupied >> (piece + 8) & 1:
+            sources.append(piece + 8)
+            if piece // 8 == 4 and not occupied >> (piece + 16) & 1:
+                sources.append(piece + 16)
+        return sources
+    return list(_squares(_PIECE_ATTACKS[material](piece, occupied) & ~occupied))
+
+
+def generate(material, tables=None):
+    """Full (unreduced) table for `material` as a bytearray indexed by _index().
+
+    KPK needs the KQK and KRK tables in `tables` for its promotions.
+    """
+    table = bytearray(TABLE_SIZE)
+    counts = {}
+    buckets = {}
+
+    def push(ply, idx):
+        buckets.setdefault(ply, []).append(idx)
+
+    for wk in range(64):
+        for bk in range(64):
+            for piece in range(64):
+                for stm in (WHITE, BLACK):
+                    idx = _index(stm, wk, bk, piece)
+                    if not _legal(material, stm, wk, bk, piece):
+                        table[idx] = ILLEGAL
+                    elif stm == BLACK:
+                        moves, in_check, capture = _black_moves(material, wk, bk, piece)
+                        if capture:
+                            continue  # taking the last white piece draws, so never lost
+                        count = bin(moves).count("1")
+                        if count:
+                            counts[idx] = count
+                        elif in_check:
+                            push(0, idx)
+                    elif material == "KPK" and piece < 16 and not (1 << wk | 1 << bk) >> (piece - 8) & 1:
+                        # promotions lead into the KQK/KRK tables
+                        for promoted in ("KQK", "KRK"):
+                            value = tables[promoted][_index(BLACK, wk, bk, piece - 8)]
+                            if value not in (DRAW, ILLEGAL):
+                                push(value, idx)  # black loses in value - 1, so white wins in value
+
+    ply = 0
+    while buckets:
+        pending = buckets.pop(ply, ())
+        for idx in pending:
+            if table[idx] != DRAW:
+                continue
+            table[idx] = ply + 1
+            rest, piece = divmod(idx, 64)
+            rest, bk = divmod(rest, 64)
+            stm, wk = divmod(rest, 64)
+            if stm == BLACK:
+                # white moved last: un-move the king or the piece
+                for source in _squares(KING_ATTACKS[wk] & ~KING_ATTACKS[bk] & ~(1 << bk | 1 << piece)):
+                    previous = _index(WHITE, source, bk, piece)
+                    if table[previous] == DRAW:
+                        push(ply + 1, previous)
+                for source in _piece_unmoves(material, wk, bk, piece):
+                    previous = _index(WHITE, wk, bk, source)
+                    if table[previous] == DRAW:
+                        push(ply + 1, previous)
+            else:
+                # black moved last: every black reply from the previous position must now lose
+                for source in _squares(KING_ATTACKS[bk] & ~KING_ATTACKS[wk] & ~(1 << wk | 1 << piece)):
+                    previous = _index(BLACK, wk, source, piece)
+                    count = counts.get(previous)
+                    if count is None:
+                        continue
+                    if count == 1:
+                        del counts[previous]
+                        push(ply + 1, previous)
+                    else:
+                        counts[previous] = count - 1
+        ply += 1
+    return table
+
+
+def reduced_index(material, stm, wk, bk, piece):
+    """Index into a stored table for a position with white as the stronger side."""
+    if material == "KPK":
+        if piece % 8 > 3:
+            wk, bk, piece = MIRROR_FILES[wk], MIRROR_FILES[bk], MIRROR_FILES[piece]
+        return ((stm * 64 + wk) * 64 + bk) * len(PAWN_SQUARES) + PAWN_INDEX[piece]
+    transform = TRIANGLE_TRANSFORM[wk]
+    return ((stm * len(TRIANGLE) + TRIANGLE_INDEX[transform[wk]]) * 64 + transform[bk]) * 64 + transform[piece]
+
+
+def reduce_table(material, table):
+    reduced = bytearray(2 * 64 * 64 * len(PAWN_SQUARES) if material == "KPK" else 2 * len(TRIANGLE) * 64 * 64)
+    for stm in (WHITE, BLACK):
+        for wk in range(64):
+            for bk in range(64):
+                for piece in (PAWN_SQUARES if material == "KPK" else range(64)):
+                    if material != "KPK" and wk not in TRIANGLE_INDEX:
+                        break
+                    reduced[reduced_index(material, stm, wk, bk, piece)] = table[_index(stm, wk, bk, piece)]
+    return reduced
+
+
+def generate_all(directory, log=None):
+    """Generate every table into `directory`; returns {material: seconds}."""
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+    timings = {}
+    for material in TABLES:
+        start = time.perf_counter()
+        tables[material] = generate(material, tables)
+        path = os.path.join(directory, material + ".tb")
+        with open(path + ".tmp", "wb") as out:
+            out.write(HEADER.pack(MAGIC, material.encode().ljust(4)))
+            out.write(reduce_table(material, tables[material]))
+        os.replace(path + ".tmp", path)
+        timings[material] = time.perf_counter() - start
+        if log:
+            log(f"{material}: {timings[material]:.1f}s -> {path}")
+    return timings
+
+
+class Tablebases:
+    def __init__(self, directory="tablebases"):
+        self.directory = directory
+        self.tables = {}
+
+    def _table(self, material):
+        if material not in self.tables:
+            path = os.path.join(self.directory, material + ".tb")
+            mapped = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if HEADER.unpack_from(mapped, 0) != (MAGIC, material.encode().ljust(4)):
+                    mapped.close()
+                    raise ValueError("not a tablebase: " + path)
+            self.tables[material] = mapped
+        return self.tables[material]
+
+    def close(self):
+        for mapped in self.tables.values():
+            if mapped is not None:
+                mapped.close()
+        self.tables = {}
+
+    def probe(self, gs):
+        """(wdl, plies to mate) for the side to move, or None if the position is not covered.
+
+        wdl is 1 for a win, 0 for a draw and -1 for a loss; plies to mate is 0 for draws.
+        """
+        squares = gs.piece_squares
+        if len(squares['w']) + len(squares['b']) > 3 or any(gs.castling_rights):
+            return None
+        if len(squares['w']) == len(squares['b']):
+            return 0, 0  # bare kings
+        strong = 'w' if len(squares['w']) == 2 else 'b'
+        ptype = next((p for p in "qrp" if gs.piece_counts[strong + p]), None)
+        if ptype is None:
+            return 0, 0  # a lone minor piece cannot mate
+        material = "K" + ptype.upper() + "K"
+        mapped = self._table(material)
+        if mapped is None:
+            return None
+        if strong == 'w':
+            (kr, kc), (lr, lc) = gs.white_king_location, gs.black_king_location
+        else:
+            (kr, kc), (lr, lc) = gs.black_king_location, gs.white_king_location
+        r, c = next(sq for sq in squares[strong] if sq != (kr, kc))
+        wk, bk, piece = kr * 8 + kc, lr * 8 + lc, r * 8 + c
+        stm = WHITE if gs.white_to_move == (strong == 'w') else BLACK
+        if strong == 'b':
+            wk, bk, piece = FLIP_RANKS[wk], FLIP_RANKS[bk], FLIP_RANKS[piece]
+        if ptype == 'p' and not 8 <= piece < 56:
+            return None  # a pawn on its first or last rank is outside the KPK table
+        value = mapped[HEADER.size + reduced_index(material, stm, wk, bk, piece)]
+        if value == ILLEGAL:
+            return None
+        if value == DRAW:
+            return 0, 0
+        return (1 if stm == WHITE else -1), value - 1
+
+    def best_move(self, gs):
+        """(move, promotion type or None) keeping the best tablebase result, or None if not covered."""
+        if self.probe(gs) is None:
+            return None
+        best, best_key = None, None
+        for move in gs.get_valid_moves():
+            for promotion in (('q', 'r', 'b', 'n') if move.is_promotion else (None,)):
+                gs.make_move(move)
+                if gs.pawn_promotion:
+                    gs.promote_pawn(gs.pawn_promotion[0] + promotion)
+                gs.get_valid_moves()
+                if gs.checkmate:
+                    result = (-1, 0)
+                else:
+                    result = self.probe(gs)
+                gs.undo_move()
+                if result is None:
+                    continue
+                wdl, plies = result
+                # prefer the opponent losing fastest, then drawing, then losing slowest
+                key = (-wdl, -plies if wdl < 0 else plies)
+                if best_key is None or key > best_key:
+                    best, best_key = (move, promotion), key
+        gs.get_valid_moves()
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe the KQK/KRK/KPK tablebases")
+    parser.add_argument("command", choices=("generate", "probe"))
+    parser.add_argument("--dir", default="tablebases", help="tablebase directory (default tablebases)")
+    parser.add_argument("--fen", help="position to probe")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_all(args.dir, log=print)
+        return 0
+    if not args.fen:
+        parser.error("probe needs --fen")
+    gs = GameState.from_fen(args.fen)
+    tablebases = Tablebases(args.dir)
+    result = tablebases.probe(gs)
+    if result is None:
+        print("position not covered")
+        return 1
+    wdl, plies = result
+    print({1: "win", 0: "draw", -1: "loss"}[wdl] + (f", mate in {plies} plies" if wdl else ""))
+    best = tablebases.best_move(gs)
+    if best:
+        move, promotion = best
+        print("best move", move.get_chess_notation() + (promotion or ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
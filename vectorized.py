@@ -0,0 +1,270 @@
+"""
+NumPy batch analysis of many unrelated positions at once (requires numpy).
+- PositionBatch packs N positions as a (12, N) uint64 array of bitboards plus side to move
+  (square index = row * 8 + col, as in bitboard.py; planes follow bitboard.PIECES)
+- sliding attacks use Kogge-Stone fills, so every step is a whole-array shift/and/or
+- attack_maps(), in_check(), mobility() and evaluate() work on the whole batch; evaluate()
+  matches search.evaluate exactly
+- to_planes() unpacks to (N, 12, 8, 8) uint8 piece planes
+
+Usage: python vectorized.py [--positions N]   (throughput benchmark)
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bitboard import PIECES
+from chess_engine import GameState
+from search import PIECE_SQUARE_VALUES
+
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+WHITE_PIECES = [PIECE_INDEX[p] for p in PIECES if p[0] == 'w']
+BLACK_PIECES = [PIECE_INDEX[p] for p in PIECES if p[0] == 'b']
+
+_U = np.uint64
+ALL = _U(0xFFFFFFFFFFFFFFFF)
+FILE_A = _U(sum(1 << (r * 8) for r in range(8)))
+FILE_H = _U(sum(1 << (r * 8 + 7) for r in range(8)))
+NOT_A = ~FILE_A
+NOT_H = ~FILE_H
+NOT_AB = ~(FILE_A | (FILE_A << _U(1)))
+NOT_GH = ~(FILE_H | (FILE_H >> _U(1)))
+ROW_2 = _U(0xFF << 48)  # white pawns' starting row (rank 2)
+ROW_7 = _U(0xFF << 8)  # black pawns' starting row (rank 7)
+
+# (shift, towards higher square indices, mask applied after each step)
+SOUTH, NORTH = (8, True, ALL), (8, False, ALL)
+EAST, WEST = (1, True, NOT_A), (1, False, NOT_H)
+SOUTH_EAST, SOUTH_WEST = (9, True, NOT_A), (7, True, NOT_H)
+NORTH_EAST, NORTH_WEST = (7, False, NOT_A), (9, False, NOT_H)
+ROOK_RAYS = (SOUTH, NORTH, EAST, WEST)
+BISHOP_RAYS = (SOUTH_EAST, SOUTH_WEST, NORTH_EAST, NORTH_WEST)
+
+# per piece: 8 byte positions x 256 byte values -> summed piece-square value of those bits
+_EVAL_TABLES = np.zeros((12, 8, 256), dtype=np.int32)
+for _piece, _index in PIECE_INDEX.items():
+    _values = np.array(PIECE_SQUARE_VALUES[_piece], dtype=np.int32).reshape(8, 8)
+    _bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    _EVAL_TABLES[_index] = (_bits @ _values.T).T * (1 if _piece[0] == 'w' else -1)
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bb):
+        return np.bitwise_count(bb).astype(np.int32)
+else:
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+    def popcount(bb):
+        total = np.zeros(bb.shape, dtype=np.int32)
+        for shift in range(0, 64, 8):
+            total += _POPCOUNT8[((bb >> _U(shift)) & _U(0xFF)).astype(np.intp)]
+        return total
+
+
+def _shift(bb, amount, up):
+    return bb << _U(amount) if up else bb >> _U(amount)
+
+
+def _step(bb, ray):
+    amount, up, mask = ray
+    return _shift(bb, amount, up) & mask
+
+
+def _slide(sliders, empty, ray):
+    """Squares attacked along `ray` by every slider bit, stopping at (and including) blockers."""
+    amount, up, mask = ray
+    propagate = empty & mask
+    sliders = sliders | propagate & _shift(sliders, amount, up)
+    propagate = propagate & _shift(propagate, amount, up)
+    sliders = sliders | propagate & _shift(sliders, 2 * amount, up)
+    propagate = propagate & _shift(propagate, 2 * amount, up)
+    sliders = sliders | propagate & _shift(sliders, 4 * amount, up)
+    return _shift(sliders, amount, up) & mask
+
+
+def knight_attacks(bb):
+    one = (bb << _U(1) & NOT_A) | (bb >> _U(1) & NOT_H)
+    two = (bb << _U(2) & NOT_AB) | (bb >> _U(2) & NOT_GH)
+    return one << _U(16) | one >> _U(16) | two << _U(8) | two >> _U(8)
+
+
+def king_attacks(bb):
+    row = bb | (bb << _U(1) & NOT_A) | (bb >> _U(1) & NOT_H)
+    return (row | row << _U(8) | row >> _U(8)) & ~bb
+
+
+def pawn_attacks(bb, white):
+    if white:
+        return _step(bb, NORTH_EAST) | _step(bb, NORTH_WEST)
+    return _step(bb, SOUTH_EAST) | _step(bb, SOUTH_WEST)
+
+
+def rook_attacks(bb, empty):
+    attacks = _slide(bb, empty, ROOK_RAYS[0])
+    for ray in ROOK_RAYS[1:]:
+        attacks |= _slide(bb, empty, ray)
+    return attacks
+
+
+def bishop_attacks(bb, empty):
+    attacks = _slide(bb, empty, BISHOP_RAYS[0])
+    for ray in BISHOP_RAYS[1:]:
+        attacks |= _slide(bb, empty, ray)
+    return attacks
+
+
+def _lsb_pieces(bb):
+    """Yield one bit per position at a time (zero where a position has run out)."""
+    bb = bb.copy()
+    while bb.any():
+        lsb = bb & (~bb + _U(1))
+        yield lsb
+        bb ^= lsb
+
+
+def _state_bitboards(gs):
+    if hasattr(gs, "bitboards"):
+        return [gs.bitboards[piece] for piece in PIECES]
+    boards = [0] * 12
+    for color in "wb":
+        for r, c in gs.piece_squares[color]:
+            boards[PIECE_INDEX[gs.board[r][c]]] |= 1 << (r * 8 + c)
+    return boards
+
+
+class PositionBatch:
+    def __init__(self, bitboards, white_to_move):
+        self.bitboards = np.ascontiguousarray(bitboards, dtype=np.uint64)
+        self.white_to_move = np.asarray(white_to_move, dtype=bool)
+
+    def __len__(self):
+        return self.bitboards.shape[1]
+
+    @classmethod
+    def from_states(cls, states):
+        """Pack GameState (or BitboardGameState) objects."""
+        rows = []
+        sides = []
+        for gs in states:
+            rows.append(_state_bitboards(gs))
+            sides.append(gs.white_to_move)
+        return cls(np.array(rows, dtype=np.uint64).reshape(-1, 12).T, sides)
+
+    @classmethod
+    def from_fens(cls, fens):
+        gs = GameState()
+        rows = []
+        sides = []
+        for fen in fens:
+            gs.load_fen(fen)
+            rows.append(_state_bitboards(gs))
+            sides.append(gs.white_to_move)
+        return cls(np.array(rows, dtype=np.uint64).reshape(-1, 12).T, sides)
+
+    def occupancy(self):
+        white = np.bitwise_or.reduce(self.bitboards[WHITE_PIECES], axis=0)
+        black = np.bitwise_or.reduce(self.bitboards[BLACK_PIECES], axis=0)
+        return white, black
+
+    def piece(self, code):
+        return self.bitboards[PIECE_INDEX[code]]
+
+
+def _side_attacks(batch, color, empty):
+    piece = batch.piece
+    queens = piece(color + 'q')
+    return (pawn_attacks(piece(color + 'p'), color == 'w')
+            | knight_attacks(piece(color + 'n'))
+            | king_attacks(piece(color + 'k'))
+            | rook_attacks(piece(color + 'r') | queens, empty)
+            | bishop_attacks(piece(color + 'b') | queens, empty))
+
+
+def attack_maps(batch):
+    """(squares attacked by white, squares attacked by black) as uint64 arrays."""
+    white, black = batch.occupancy()
+    empty = ~(white | black)
+    return _side_attacks(batch, 'w', empty), _side_attacks(batch, 'b', empty)
+
+
+def in_check(batch, maps=None):
+    """Bool array: is the side to move in check?"""
+    white_attacks, black_attacks = maps if maps is not None else attack_maps(batch)
+    white_checked = (batch.piece('wk') & black_attacks) != 0
+    black_checked = (batch.piece('bk') & white_attacks) != 0
+    return np.where(batch.white_to_move, white_checked, black_checked)
+
+
+def _color_mobility(batch, color, own, enemy):
+    empty = ~(own | enemy)
+    piece = batch.piece
+    count = np.zeros(len(batch), dtype=np.int32)
+    for ptype, attacks in (('n', knight_attacks), ('k', king_attacks),
+                           ('b', lambda bb: bishop_attacks(bb, empty)),
+                           ('r', lambda bb: rook_attacks(bb, empty)),
+                           ('q', lambda bb: rook_attacks(bb, empty) | bishop_attacks(bb, empty))):
+        for single in _lsb_pieces(piece(color + ptype)):
+            count += popcount(attacks(single) & ~own)
+    pawns = piece(color + 'p')
+    white = color == 'w'
+    forward = NORTH if white else SOUTH
+    single_pushes = _step(pawns, forward) & empty
+    double_pushes = _step(single_pushes & _step(ROW_2 if white else ROW_7, forward), forward) & empty
+    count += popcount(single_pushes) + popcount(double_pushes)
+    for ray in ((NORTH_EAST, NORTH_WEST) if white else (SOUTH_EAST, SOUTH_WEST)):
+        count += popcount(_step(pawns, ray) & enemy)
+    return count
+
+
+def mobility(batch):
+    """(white, black) pseudo-legal move counts per position: no castling or en passant,
+    a promotion counts once, and moves leaving the king in check are included."""
+    white, black = batch.occupancy()
+    return _color_mobility(batch, 'w', white, black), _color_mobility(batch, 'b', black, white)
+
+
+def evaluate(batch):
+    """Material plus piece-square score (int32, centipawns) from the side to move's point of view,
+    equal to search.evaluate for each position."""
+    score = np.zeros(len(batch), dtype=np.int32)
+    for index in range(12):
+        bb = batch.bitboards[index]
+        if not bb.any():
+            continue
+        table = _EVAL_TABLES[index]
+        for row in range(8):
+            score += table[row][((bb >> _U(row * 8)) & _U(0xFF)).astype(np.intp)]
+    return np.where(batch.white_to_move, score, -score)
+
+
+def to_planes(batch):
+    """(N, 12, 8, 8) uint8 piece planes, row 0 = rank 8."""
+    as_bytes = np.ascontiguousarray(batch.bitboards.T, dtype="<u8").view(np.uint8).reshape(len(batch), 12, 8)
+    return np.unpackbits(as_bytes, axis=2, bitorder="little").reshape(len(batch), 12, 8, 8)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized batch analysis")
+    parser.add_argument("--positions", type=int, default=1000000, help="batch size (default 1000000)")
+    args = parser.parse_args(argv)
+
+    sample = [GameState.from_fen(fen) for fen in (
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1")]
+    base = PositionBatch.from_states(sample)
+    repeat = -(-args.positions // len(base))
+    batch = PositionBatch(np.tile(base.bitboards, repeat)[:, :args.positions],
+                          np.tile(base.white_to_move, repeat)[:args.positions])
+    for name, function in (("attack_maps", attack_maps), ("in_check", in_check),
+                           ("mobility", mobility), ("evaluate", evaluate)):
+        start = time.perf_counter()
+        function(batch)
+        elapsed = time.perf_counter() - start
+        print(f"{name:12} {len(batch)} positions in {elapsed:.3f}s ({len(batch) / elapsed:,.0f} positions/s)")
+
+
+if __name__ == "__main__":
+    main()